@@ -2,38 +2,26 @@ import header as h
 import transferUtils
 
 
-cu_header = h.Header(json_file="cu_download_format.json")
-with open("downloads/ExportedTransactions.csv", "r") as f:
-    line_num = 0
-    for line in f:
-        line = line.strip()
-        line = transferUtils.clear_commas_in_quotes(' ', line)
-        if line_num == 0:
-            cu_header.validate_header_field_names(line.split(','))
-        else:
-            cu_header.validate_data_field_values(line.split(','))
-        line_num += 1
+def validate_download_file(header, file_name):
+    """Validate the header and every data line of a download file, and print all the failures
 
-citi_header = h.Header(json_file="citi_download_format.json")
-with open("downloads/Citi-RecentActivity.CSV", "r") as f:
-    line_num = 0
-    for line in f:
-        line = line.strip()
-        line = transferUtils.clear_commas_in_quotes(' ', line)
-        if line_num == 0:
-            citi_header.validate_header_field_names(line.split(','))
-        else:
-            citi_header.validate_data_field_values(line.split(','))
-        line_num += 1
+    :param h.Header header: the expected header of the download file
+    :param str file_name: name of the download file
+    """
+    malformed = []
+    with open(file_name, "r") as f:
+        lines = transferUtils.tokenize_download_file(f, malformed=malformed)
+        for _, fields, _ in lines:  # the first line is the header
+            header.validate_header_field_names(fields)
+            break
+        failures = header.validate_data_rows((line_num, fields) for line_num, fields, _ in lines)
+    for error in malformed:
+        print(f"{file_name}: {error}")
+    for failure in failures:
+        print(f"{file_name} line {failure.line_num}: {failure.message}")
+    print(f"{file_name}: {len(malformed) + len(failures)} problems found")
 
-discover_header = h.Header(json_file="discover_download_format.json")
-with open("downloads/Discover-RecentActivity.csv", "r") as f:
-    line_num = 0
-    for line in f:
-        line = line.strip()
-        line = transferUtils.clear_commas_in_quotes(' ', line)
-        if line_num == 0:
-            discover_header.validate_header_field_names(line.split(','))
-        else:
-            discover_header.validate_data_field_values(line.split(','))
-        line_num += 1
+
+validate_download_file(h.Header(json_file="cu_download_format.json"), "downloads/ExportedTransactions.csv")
+validate_download_file(h.Header(json_file="citi_download_format.json"), "downloads/Citi-RecentActivity.CSV")
+validate_download_file(h.Header(json_file="discover_download_format.json"), "downloads/Discover-RecentActivity.csv")
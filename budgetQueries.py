@@ -5,6 +5,28 @@ import pymysql
 import WindowUtils
 
 
+def query_cleared_unrecorded_checks(cursor, since_date=None):
+    """Return the credit union checks that cleared the bank but have no recorded amount in the checks table.
+
+    Uses a single anti-join instead of looking up each cleared check in the checks table separately.
+
+    :param pymysql.cursors.Cursor cursor: the database cursor to run the query on
+    :param datetime.date since_date: only return checks that cleared on or after this date (optional)
+    :returns: rows of (tran_checknum, tran_date, tran_amount) ordered by check number
+    :rtype: list[tuple]
+    """
+    query = ("select m.tran_checknum,m.tran_date,m.tran_amount from main m where m.tran_checknum != '0' "
+             "and m.tran_type = 'b' ")
+    params = []
+    if since_date is not None:
+        query += "and m.tran_date >= %s "
+        params.append(since_date)
+    query += ("and not exists (select 1 from checks c where c.tchecknum = m.tran_checknum and c.tamt is not null) "
+              "order by m.tran_checknum;")
+    cursor.execute(query, params)
+    return list(cursor)
+
+
 class BudgetDB(object):
     """Class to handle database initialization and closing.
 
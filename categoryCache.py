@@ -0,0 +1,152 @@
+"""Persistent cache of payee budget category lookups"""
+
+import os
+import json
+import hashlib
+from collections import OrderedDict
+from downloadDates import parse_date
+from ingestJournal import file_hash
+from utils import atomic_write
+
+
+def budget_month(date_string):
+    """Return the 'yyyymm' budget month of a 'mm/dd/yyyy' date string
+
+    :param str date_string: the date string
+    :rtype: str
+    """
+    date = parse_date(date_string)
+    return f"{date.year:04d}{date.month:02d}"
+
+
+def files_fingerprint(file_names):
+    """Return a hash of the contents of the given files. A missing file hashes as empty.
+
+    :param list[str] file_names: the files to hash
+    :rtype: str
+    """
+    sha = hashlib.sha256()
+    for file_name in file_names:
+        sha.update(file_name.encode('utf-8') + b'\0')
+        if os.path.exists(file_name):
+            sha.update(file_hash(file_name).encode('ascii'))
+        sha.update(b'\0')
+    return sha.hexdigest()
+
+
+class CategoryCache(object):
+    """In-memory LRU cache of budget categories keyed by (payee, budget month), saved to disk between runs.
+
+    Payee rule categories only change at month boundaries, so the category of a payee string is the same
+    for every day of a month. The cache file records a fingerprint of the rule source files and is
+    discarded when any of them change.
+
+    :param str file_name: the name of the cache file
+    :param list[str] source_files: the files the cached categories were computed from
+    :param int max_entries: the maximum number of entries to keep (default = 50000)
+    """
+    def __init__(self, file_name, source_files, max_entries=50000):
+        self.file_name = file_name
+        self.max_entries = max_entries
+        self.fingerprint = files_fingerprint(source_files)
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._added = OrderedDict()  # entries put since the last take_updates()
+        self._dirty = False
+        self._load()
+
+    def _load(self):
+        """Load the cache file if it exists and was built from the current rule source files"""
+        if not os.path.exists(self.file_name):
+            return
+        try:
+            with open(self.file_name, 'r') as f_ptr:
+                data = json.load(f_ptr)
+        except (OSError, ValueError):
+            return  # unreadable cache is the same as no cache
+        if data.get('fingerprint') != self.fingerprint:
+            self._dirty = True  # rules changed: the stale file gets overwritten on save
+            return
+        for payee, month, category in data.get('entries', [])[-self.max_entries:]:
+            self._entries[(payee, month)] = category
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, payee, month):
+        """Return the cached category for the payee in the budget month, or None if not cached.
+
+        :param str payee: the payee string
+        :param str month: the 'yyyymm' budget month
+        :rtype: str|None
+        """
+        key = (payee, month)
+        category = self._entries.get(key)
+        if category is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return category
+
+    def put(self, payee, month, category):
+        """Cache the category for the payee in the budget month, evicting the least recently used entry
+        if the cache is full.
+
+        :param str payee: the payee string
+        :param str month: the 'yyyymm' budget month
+        :param str category: the budget category
+        """
+        self._entries[(payee, month)] = category
+        self._entries.move_to_end((payee, month))
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self._added[(payee, month)] = category
+        self._dirty = True
+
+    def take_updates(self):
+        """Return the entries put and the hit/miss counters since the last call, and reset them. A worker
+        process sends these back for merge() into the cache that gets saved.
+
+        :returns: ([payee, month, category] entries, hits, misses)
+        :rtype: (list[list[str]], int, int)
+        """
+        updates = ([[payee, month, category] for (payee, month), category in self._added.items()],
+                   self.hits, self.misses)
+        self._added.clear()
+        self.hits = 0
+        self.misses = 0
+        return updates
+
+    def merge(self, entries, hits=0, misses=0):
+        """Add the entries and hit/miss counters of another cache, as returned by its take_updates()
+
+        :param list[list[str]] entries: the [payee, month, category] entries to put
+        :param int hits: the other cache's hits
+        :param int misses: the other cache's misses
+        """
+        for payee, month, category in entries:
+            self.put(payee, month, category)
+        self.hits += hits
+        self.misses += misses
+
+    def save(self):
+        """Write the cache to disk (least recently used entries first) if it changed."""
+        if not self._dirty:
+            return
+        data = {'fingerprint': self.fingerprint,
+                'entries': [[payee, month, category] for (payee, month), category in self._entries.items()]}
+        with atomic_write(self.file_name) as f_ptr:
+            json.dump(data, f_ptr)
+        self._dirty = False
+
+    def stats(self):
+        """Return a one-line summary of the cache counters
+
+        :rtype: str
+        """
+        lookups = self.hits + self.misses
+        hit_rate = (100.0 * self.hits / lookups) if lookups else 0.0
+        return (f"Category cache: {self.hits} hits, {self.misses} misses ({hit_rate:.1f}% hit rate), "
+                f"{len(self._entries)} entries")
@@ -0,0 +1,49 @@
+"""Memoized parsing of the 'mm/dd/yyyy' dates in the download and payee files"""
+
+import datetime
+from functools import lru_cache
+
+# A download file spans a few hundred distinct dates, so a bounded table holds all of a run's dates while
+# keeping a long-running process from growing without limit
+DATE_CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def parse_date(date_string):
+    """Return the date of a 'mm/dd/yyyy' string. Each distinct string is parsed once.
+
+    :param str date_string: the date string
+    :raises ValueError: if the string is not a 'mm/dd/yyyy' date
+    :rtype: datetime.date
+    """
+    month, day, year = date_string.split('/')
+    return datetime.date(int(year), int(month), int(day))
+
+
+def to_date(tran_date):
+    """Return tran_date as a datetime.date. Accepts a date or a 'mm/dd/yyyy' string.
+
+    :param datetime.date|str tran_date: the transaction date
+    :rtype: datetime.date
+    """
+    if isinstance(tran_date, datetime.date):
+        return tran_date
+    return parse_date(tran_date)
+
+
+def day_ordinal(date_string):
+    """Return the proleptic Gregorian ordinal of a 'mm/dd/yyyy' date string
+
+    :param str date_string: the date string
+    :rtype: int
+    """
+    return parse_date(date_string).toordinal()
+
+
+def format_date(date):
+    """Return the date as a 'mm/dd/yyyy' string, or '' if there is no date
+
+    :param datetime.date date: the date
+    :rtype: str
+    """
+    return date.strftime('%m/%d/%Y') if date else ''
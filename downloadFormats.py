@@ -0,0 +1,148 @@
+"""Process-wide registry of the supported download formats and their field maps"""
+
+import json
+import threading
+from collections import namedtuple
+from types import MappingProxyType
+import header as h
+from rowConverters import compile_row_converter
+
+SUPPORTED_DOWNLOADS_FILE = 'supported_downloads.json'
+MAP_FILE = 'map_download_to_db.json'
+
+# Field map keys whose values are field indices in the download file
+INDEX_KEYS = ('tid', 'date', 'date2', 'amount', 'credit', 'debit', 'payee', 'check', 'status', 'member',
+              'reference', 'category')
+TID_DATE_FORMATS = ('yyyymmdd', 'mmddyyyy')
+
+# A compiled download source. field_map is a read-only mapping (lists in it are tuples), header holds
+# the precompiled row validator and converter the row conversion functions compiled from the field map.
+# The header is shared, so it must not be edited.
+SourceFormat = namedtuple('SourceFormat', ['key', 'format_file', 'field_map', 'header', 'num_fields', 'converter'])
+
+
+class FormatDefinitionError(ValueError):
+    """A download format or field map definition is missing or inconsistent"""
+
+
+def default_format_file(key):
+    """Return the name of the format file of a download source
+
+    :param str key: the download source key, e.g. 'cu'
+    :rtype: str
+    """
+    return f"{key}_download_format.json"
+
+
+def compile_source(key, field_map, format_file):
+    """Validate a field map against its format file and return the compiled source
+
+    :param str key: the download source key
+    :param dict field_map: the source's field map from the map file
+    :param str format_file: the source's format file name
+    :rtype: SourceFormat
+    """
+    try:
+        header = h.Header(json_file=format_file)
+    except (OSError, ValueError, KeyError) as exc:
+        raise FormatDefinitionError(f"Cannot load format file {format_file} for '{key}': {exc}") from exc
+    num_fields = header.num_fields
+    if num_fields == 0:
+        raise FormatDefinitionError(f"Format file {format_file} for '{key}' has no fields")
+
+    for required in ('type', 'date', 'payee', 'negate'):
+        if required not in field_map:
+            raise FormatDefinitionError(f"Field map for '{key}' has no '{required}' key")
+    if 'amount' not in field_map and not ('credit' in field_map and 'debit' in field_map):
+        raise FormatDefinitionError(f"Field map for '{key}' needs 'amount' or both 'credit' and 'debit'")
+    for index_key in INDEX_KEYS:
+        if index_key in field_map:
+            index = field_map[index_key]
+            if not isinstance(index, int) or isinstance(index, bool) or not 0 <= index < num_fields:
+                raise FormatDefinitionError(f"Field map for '{key}' has '{index_key}' index {index!r} outside "
+                                            f"the {num_fields} fields of {format_file}")
+    if 'tid' not in field_map:
+        if 'md5' not in field_map or not field_map.get('tid_fields'):
+            raise FormatDefinitionError(f"Field map for '{key}' needs 'tid', or 'tid_fields' and 'md5'")
+        for fld in field_map['tid_fields']:
+            if fld not in ('date', 'amount', 'payee') and fld not in field_map:
+                raise FormatDefinitionError(f"Key field '{fld}' not found in field_map for {key}")
+    window_days = field_map.get('duplicate_window_days', 0)
+    if not isinstance(window_days, int) or isinstance(window_days, bool) or window_days < 0:
+        raise FormatDefinitionError(f"Field map for '{key}' has a 'duplicate_window_days' of {window_days!r}; "
+                                    "it must be a whole number of days")
+    if 'tid_date_format' in field_map and field_map['tid_date_format'] not in TID_DATE_FORMATS:
+        raise FormatDefinitionError(f"tid_date_format {field_map['tid_date_format']} of '{key}' must be one of "
+                                    f"{TID_DATE_FORMATS}")
+
+    frozen_map = MappingProxyType({name: (tuple(value) if isinstance(value, list) else value)
+                                   for name, value in field_map.items()})
+    return SourceFormat(key, format_file, frozen_map, header, num_fields, compile_row_converter(frozen_map))
+
+
+class FormatRegistry(object):
+    """Loads the supported downloads, the field maps and every supported source's format file once, and
+    cross-checks them, so any problem with the definitions is reported before a file is read.
+
+    :param str map_file: the field map file name (default = map_download_to_db.json)
+    :param str supported_file: the supported downloads file name (default = supported_downloads.json)
+    """
+    def __init__(self, map_file=MAP_FILE, supported_file=SUPPORTED_DOWNLOADS_FILE):
+        self.map_file = map_file
+        with open(supported_file, "r") as f:
+            self.supported = tuple(json.load(f))
+        with open(map_file, "r") as f:
+            self._field_maps = json.load(f)
+        self._sources = dict()
+        for key in self.supported:
+            if key not in self._field_maps:
+                raise FormatDefinitionError(f"Key '{key}' not found in map file {map_file}")
+            format_file = default_format_file(key)
+            self._sources[(key, format_file)] = compile_source(key, self._field_maps[key], format_file)
+
+    def source(self, key, format_file=None):
+        """Return the compiled source for the key. A format file other than the source's own is compiled the
+        first time it is asked for.
+
+        :param str key: the download source key, e.g. 'cu'
+        :param str format_file: the format file name (default = the source's own format file)
+        :rtype: SourceFormat
+        """
+        if key not in self.supported:
+            raise FormatDefinitionError(f"Key '{key}' not found in supported_downloads '{list(self.supported)}'")
+        format_file = format_file or default_format_file(key)
+        compiled = self._sources.get((key, format_file))
+        if compiled is None:
+            compiled = compile_source(key, self._field_maps[key], format_file)
+            self._sources[(key, format_file)] = compiled
+        return compiled
+
+
+# One registry per map file for the whole process
+_registries = dict()
+_registries_lock = threading.Lock()
+
+
+def get_registry(map_file=MAP_FILE):
+    """Return the process-wide registry for the map file, loading it the first time
+
+    :param str map_file: the field map file name (default = map_download_to_db.json)
+    :rtype: FormatRegistry
+    """
+    with _registries_lock:
+        registry = _registries.get(map_file)
+        if registry is None:
+            registry = FormatRegistry(map_file)
+            _registries[map_file] = registry
+        return registry
+
+
+def get_source(key, map_file=MAP_FILE, format_file=None):
+    """Return the compiled source for the key from the process-wide registry
+
+    :param str key: the download source key, e.g. 'cu'
+    :param str map_file: the field map file name (default = map_download_to_db.json)
+    :param str format_file: the format file name (default = the source's own format file)
+    :rtype: SourceFormat
+    """
+    return get_registry(map_file).source(key, format_file)
@@ -0,0 +1,147 @@
+"""In-memory index of main table records for finding possible duplicate transactions"""
+
+from bisect import bisect_left, bisect_right
+from money import parse_cents
+from downloadDates import to_date
+
+# Longest transaction description stored in the main table
+MAX_DESC_LENGTH = 120
+
+def normalize_description(tran_desc):
+    """Return the description as stored, lower case, with runs of whitespace collapsed to one space
+
+    :param str tran_desc: the transaction description
+    :rtype: str
+    """
+    return ' '.join(tran_desc[:MAX_DESC_LENGTH].split()).lower()
+
+
+class DuplicateIndex(object):
+    """Index of main table records by (transaction date, description, amount, check number).
+
+    The keys are normalized the way MySQL compares the columns: descriptions are truncated to the stored
+    length, compared case-insensitively and without trailing spaces, amounts are whole cents and an empty
+    check number is the same as 0.
+
+    The records are also indexed for near matches by (amount in cents, description with whitespace
+    collapsed, check number), each key holding its records in date order, so lookup_near() finds the
+    records within some days of a date with two binary searches.
+
+    Each indexed record is the tuple (tran_ID, tran_date, tran_desc, tran_checknum, amount_cents).
+    """
+    def __init__(self):
+        self._index = {}
+        self._near = {}
+        self._keys_by_id = {}
+
+    @staticmethod
+    def make_key(tran_date, tran_desc, amount_cents, tran_checknum):
+        """Return the normalized index key of a transaction
+
+        :param datetime.date|str tran_date: the transaction date
+        :param str tran_desc: the transaction description
+        :param int amount_cents: the transaction amount in cents
+        :param int|str tran_checknum: the check number, or '' if not a check
+        :rtype: tuple
+        """
+        return (to_date(tran_date),
+                tran_desc[:MAX_DESC_LENGTH].rstrip().lower(),
+                amount_cents,
+                int(tran_checknum) if tran_checknum else 0)
+
+    @staticmethod
+    def make_near_key(tran_desc, amount_cents, tran_checknum):
+        """Return the near-match index key of a transaction, which leaves out the date
+
+        :param str tran_desc: the transaction description
+        :param int amount_cents: the transaction amount in cents
+        :param int|str tran_checknum: the check number, or '' if not a check
+        :rtype: tuple
+        """
+        return amount_cents, normalize_description(tran_desc), int(tran_checknum) if tran_checknum else 0
+
+    def load(self, cursor, start_date, end_date):
+        """Index all the main table records with transaction dates from start_date to end_date inclusive
+
+        :param pymysql.cursors.Cursor cursor: the database cursor
+        :param datetime.date start_date: the first date to load
+        :param datetime.date end_date: the last date to load
+        """
+        # in date order, so each record is appended to the end of its near-match list
+        cursor.execute('SELECT tran_ID,tran_date,tran_desc,tran_checknum,tran_amount from main where '
+                       'tran_date between %s and %s order by tran_date;', (start_date, end_date))
+        for tran_id, tran_date, tran_desc, tran_checknum, tran_amount in cursor:
+            self.add(tran_id, tran_date, tran_desc, tran_checknum, parse_cents(tran_amount))
+
+    def add(self, tran_id, tran_date, tran_desc, tran_checknum, amount_cents):
+        """Add a record to the index
+
+        :param str tran_id: the transaction ID
+        :param datetime.date|str tran_date: the transaction date
+        :param str tran_desc: the transaction description
+        :param int|str tran_checknum: the check number
+        :param int amount_cents: the transaction amount in cents
+        """
+        row = (tran_id, tran_date, tran_desc, tran_checknum, amount_cents)
+        key = self.make_key(tran_date, tran_desc, amount_cents, tran_checknum)
+        self._index.setdefault(key, []).append(row)
+        self._keys_by_id.setdefault(tran_id, set()).add(key)
+
+        # ordinals and rows are parallel lists in date order
+        ordinals, rows = self._near.setdefault(self.make_near_key(tran_desc, amount_cents, tran_checknum), ([], []))
+        ordinal = to_date(tran_date).toordinal()
+        position = bisect_right(ordinals, ordinal)
+        ordinals.insert(position, ordinal)
+        rows.insert(position, row)
+
+    def remove(self, tran_id):
+        """Remove every record with the given transaction ID from the index
+
+        :param str tran_id: the transaction ID
+        """
+        for key in self._keys_by_id.pop(tran_id, ()):
+            removed = [row for row in self._index[key] if row[0] == tran_id]
+            rows = [row for row in self._index[key] if row[0] != tran_id]
+            if rows:
+                self._index[key] = rows
+            else:
+                del self._index[key]
+            for near_key in set(self.make_near_key(row[2], row[4], row[3]) for row in removed):
+                ordinals, near_rows = self._near[near_key]
+                keep = [i for i, near_row in enumerate(near_rows) if near_row[0] != tran_id]
+                if keep:
+                    self._near[near_key] = ([ordinals[i] for i in keep], [near_rows[i] for i in keep])
+                else:
+                    del self._near[near_key]
+
+    def lookup(self, tran_date, tran_desc, amount_cents, tran_checknum):
+        """Return the indexed records matching the transaction
+
+        :param datetime.date|str tran_date: the transaction date
+        :param str tran_desc: the transaction description
+        :param int amount_cents: the transaction amount in cents
+        :param int|str tran_checknum: the check number, or '' if not a check
+        :rtype: list[tuple]
+        """
+        return list(self._index.get(self.make_key(tran_date, tran_desc, amount_cents, tran_checknum), []))
+
+    def lookup_near(self, tran_date, tran_desc, amount_cents, tran_checknum, window_days):
+        """Return the indexed records with the same amount, check number and description apart from case and
+        whitespace, dated within window_days of the transaction date, nearest dates first
+
+        :param datetime.date|str tran_date: the transaction date
+        :param str tran_desc: the transaction description
+        :param int amount_cents: the transaction amount in cents
+        :param int|str tran_checknum: the check number, or '' if not a check
+        :param int window_days: the most days apart a record's date can be
+        :rtype: list[tuple]
+        """
+        entry = self._near.get(self.make_near_key(tran_desc, amount_cents, tran_checknum))
+        if entry is None:
+            return []
+        ordinals, rows = entry
+        ordinal = to_date(tran_date).toordinal()
+        first = bisect_left(ordinals, ordinal - window_days)
+        last = bisect_right(ordinals, ordinal + window_days)
+        nearby = sorted(range(first, last), key=lambda i: abs(ordinals[i] - ordinal))
+        return [rows[i] for i in nearby]
@@ -0,0 +1,270 @@
+r"""Rule-driven resolution of possible duplicate records, and the review queue for undecided ones
+
+The policy file is json:
+
+    {
+      "default": "ask",
+      "rules": [
+        {"name": "cu id change", "source": "cu", "existing_id_regex": "^ID", "new_id_regex": "^\\d+$",
+         "action": "replace"},
+        {"name": "small old card charges", "source": ["citi", "discover"], "max_amount": 20.0,
+         "min_age_days": 60, "action": "ignore"}
+      ]
+    }
+
+Every condition of a rule is optional, and all the given ones must hold for the rule to apply:
+    source             download source key (or list of keys) of the new record, e.g. 'cu'
+    min_amount         lowest absolute transaction amount
+    max_amount         highest absolute transaction amount
+    min_age_days       fewest days between the transaction date and today
+    max_age_days       most days between the transaction date and today
+    existing_id_regex  regex the existing record's transaction ID must match (re.search)
+    new_id_regex       regex the new record's transaction ID must match (re.search)
+
+The first rule that applies decides the action, otherwise the default does. The actions are 'insert',
+'ignore', 'replace' (only possible when there is exactly one existing record, otherwise 'review'), 'review'
+(queue the record in the duplicate_review table without inserting it) and 'ask' (ask the user, or 'review'
+when running unattended).
+"""
+
+import os
+import re
+import json
+import datetime
+from collections import namedtuple
+import downloadFormats
+from money import parse_cents
+from downloadDates import to_date
+
+INSERT = 'insert'
+IGNORE = 'ignore'
+REPLACE = 'replace'
+REVIEW = 'review'
+ASK = 'ask'
+ACTIONS = (INSERT, IGNORE, REPLACE, REVIEW, ASK)
+
+# duplicate_review statuses of the records that are not in the main table
+PENDING = 'pending'
+IGNORED = 'ignored'
+
+RULE_CONDITIONS = ('name', 'action', 'source', 'min_amount', 'max_amount', 'min_age_days', 'max_age_days',
+                   'existing_id_regex', 'new_id_regex')
+
+# The outcome of DuplicatePolicy.decide(). reason names the rule that decided, for the log and review queue.
+Decision = namedtuple('Decision', ['action', 'reason'])
+
+
+class DuplicatePolicyError(ValueError):
+    """The duplicate policy file is invalid"""
+
+
+class DuplicateRule(object):
+    """One rule of the duplicate policy, with its regexes compiled and its sources resolved to transaction
+    types.
+
+    :param dict rule: the rule from the policy file
+    :param int number: the position of the rule in the file, to name unnamed rules
+    """
+    def __init__(self, rule, number):
+        unknown = set(rule) - set(RULE_CONDITIONS)
+        if unknown:
+            raise DuplicatePolicyError(f"Duplicate policy rule {number} has unknown conditions {sorted(unknown)}")
+        if rule.get('action') not in ACTIONS:
+            raise DuplicatePolicyError(f"Duplicate policy rule {number} action must be one of {ACTIONS}")
+        self.name = rule.get('name', f"rule {number}")
+        self.action = rule['action']
+        self.tran_types = None
+        if 'source' in rule:
+            sources = [rule['source']] if isinstance(rule['source'], str) else rule['source']
+            try:
+                registry = downloadFormats.get_registry()
+                self.tran_types = {registry.source(source).field_map['type'] for source in sources}
+            except downloadFormats.FormatDefinitionError as exc:
+                raise DuplicatePolicyError(f"Duplicate policy rule '{self.name}': {exc}") from exc
+        # the amount limits are dollars in the file, and cents here
+        self.min_cents = parse_cents(rule['min_amount']) if 'min_amount' in rule else None
+        self.max_cents = parse_cents(rule['max_amount']) if 'max_amount' in rule else None
+        self.min_age_days = rule.get('min_age_days')
+        self.max_age_days = rule.get('max_age_days')
+        try:
+            self.existing_id_regex = re.compile(rule['existing_id_regex']) if 'existing_id_regex' in rule else None
+            self.new_id_regex = re.compile(rule['new_id_regex']) if 'new_id_regex' in rule else None
+        except re.error as exc:
+            raise DuplicatePolicyError(f"Duplicate policy rule '{self.name}' has a bad regex: {exc}") from exc
+
+    def applies(self, new_key, tran_type, amount_cents, age_days, existing_ids):
+        """Return True if every condition of the rule holds
+
+        :param str new_key: the transaction ID of the new record
+        :param str tran_type: the transaction type of the new record
+        :param int amount_cents: the absolute transaction amount in cents
+        :param int age_days: days from the transaction date to today
+        :param list[str] existing_ids: the transaction IDs of the existing records
+        :rtype: bool
+        """
+        if self.tran_types is not None and tran_type not in self.tran_types:
+            return False
+        if self.min_cents is not None and amount_cents < self.min_cents:
+            return False
+        if self.max_cents is not None and amount_cents > self.max_cents:
+            return False
+        if self.min_age_days is not None and age_days < self.min_age_days:
+            return False
+        if self.max_age_days is not None and age_days > self.max_age_days:
+            return False
+        if self.existing_id_regex is not None and not all(self.existing_id_regex.search(existing_id)
+                                                          for existing_id in existing_ids):
+            return False
+        if self.new_id_regex is not None and not self.new_id_regex.search(new_key):
+            return False
+        return True
+
+
+class DuplicatePolicy(object):
+    """Decides what to do with a possible duplicate record without asking the user, where the rules allow.
+
+    :param list[dict] rules: the rules, in priority order
+    :param str default: the action when no rule applies (default = 'ask')
+    :param bool unattended: never ask the user: 'ask' becomes 'review' (default = False)
+    """
+    def __init__(self, rules=(), default=ASK, unattended=False):
+        if default not in ACTIONS:
+            raise DuplicatePolicyError(f"Duplicate policy default must be one of {ACTIONS}")
+        self.rules = [DuplicateRule(rule, number) for number, rule in enumerate(rules, 1)]
+        self.default = default
+        self.unattended = unattended
+
+    @classmethod
+    def load(cls, file_name, unattended=False):
+        """Return the policy in the file. Without a policy file, every possible duplicate is asked about (or
+        queued for review when unattended), like before there were policies.
+
+        :param str file_name: the policy file name
+        :param bool unattended: never ask the user (default = False)
+        :rtype: DuplicatePolicy
+        """
+        if not os.path.exists(file_name):
+            return cls(unattended=unattended)
+        with open(file_name, 'r') as f_ptr:
+            policy = json.load(f_ptr)
+        return cls(policy.get('rules', []), policy.get('default', ASK), unattended=unattended)
+
+    def decide(self, new_key, tran_date, tran_type, amount_cents, existing_ids, today=None):
+        """Return the action for a new record that possibly duplicates the existing records
+
+        :param str new_key: the transaction ID of the new record
+        :param str tran_date: the 'mm/dd/yyyy' transaction date of the new record
+        :param str tran_type: the transaction type of the new record
+        :param int amount_cents: the transaction amount of the new record in cents
+        :param list[str] existing_ids: the transaction IDs of the existing records
+        :param datetime.date today: the date to measure the record's age from (default = today)
+        :rtype: Decision
+        """
+        amount_cents = abs(amount_cents)
+        age_days = ((today or datetime.date.today()) - to_date(tran_date)).days
+        action, reason = self.default, 'default'
+        for rule in self.rules:
+            if rule.applies(new_key, tran_type, amount_cents, age_days, existing_ids):
+                action, reason = rule.action, rule.name
+                break
+        if action == REPLACE and len(existing_ids) != 1:
+            action, reason = REVIEW, f"{reason} (cannot replace {len(existing_ids)} records)"
+        if action == ASK and self.unattended:
+            action, reason = REVIEW, f"{reason} (unattended)"
+        return Decision(action, reason)
+
+
+class ReviewQueue(object):
+    """The duplicate_review table of new records held back as possible duplicates, and their resolution.
+
+    Queued records have the main table's columns, the IDs of the records they may duplicate, the reason
+    they were queued and a status of 'pending' until resolved as 'inserted', 'ignored' or 'replaced'.
+    None of the methods commit; the caller commits or rolls back.
+
+    :param pymysql.cursors.Cursor cursor: the database cursor
+    """
+    TABLE_QUERY = ('CREATE TABLE IF NOT EXISTS duplicate_review ('
+                   'review_id int NOT NULL AUTO_INCREMENT PRIMARY KEY, queued_at timestamp DEFAULT CURRENT_TIMESTAMP, '
+                   'tran_date date, tran_ID varchar(255), tran_desc varchar(120), tran_checknum int, '
+                   'tran_type varchar(4), tran_amount decimal(12,2), bud_category varchar(255), '
+                   'bud_amount decimal(12,2), bud_date date, comment varchar(255), existing_ids text, '
+                   'reason varchar(255), status varchar(16) NOT NULL DEFAULT \'pending\', resolved_at datetime, '
+                   'KEY (status), KEY (tran_ID));')
+    # All-placeholder VALUES, like ProcessDownloads.INSERT_MAIN_QUERY, so executemany() batches the rows
+    ENQUEUE_QUERY = ('INSERT into duplicate_review (tran_date,tran_ID,tran_desc,tran_checknum,tran_type,tran_amount,'
+                     'bud_category,bud_amount,bud_date,comment,existing_ids,reason) '
+                     'VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)')
+    MAIN_COLUMNS = ('tran_date,tran_ID,tran_desc,tran_checknum,tran_type,tran_amount,bud_category,bud_amount,'
+                    'bud_date,comment')
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def ensure_table(self):
+        """Create the review table if it doesn't exist. DDL commits implicitly in MySQL, so call this before
+        starting a transaction.
+        """
+        self._cursor.execute(self.TABLE_QUERY)
+
+    @staticmethod
+    def queue_row(main_row, existing_ids, reason):
+        """Return the ENQUEUE_QUERY parameters of a record
+
+        :param tuple main_row: the record's parameters for the main table insert, in MAIN_COLUMNS order
+        :param list[str] existing_ids: the transaction IDs of the records it may duplicate
+        :param str reason: why it was queued
+        :rtype: tuple
+        """
+        return tuple(main_row) + (','.join(existing_ids), reason[:255])
+
+    def queued_ids(self):
+        """Return the status of the transaction IDs that are pending, or were resolved as ignored. Both are
+        left out of later downloads, so an ignored record isn't queued again while it is still in the
+        download files.
+
+        :returns: 'pending' or 'ignored' by transaction ID
+        :rtype: dict[str, str]
+        """
+        self._cursor.execute("SELECT tran_ID,status from duplicate_review where status in ('pending', 'ignored');")
+        return {tran_id: status for tran_id, status in self._cursor}
+
+    def pending(self):
+        """Return the pending records, oldest first
+
+        :returns: rows of (review_id, tran_ID, tran_date, tran_desc, tran_amount, existing_ids, reason)
+        :rtype: list[tuple]
+        """
+        self._cursor.execute("SELECT review_id,tran_ID,tran_date,tran_desc,tran_amount,existing_ids,reason from "
+                             "duplicate_review where status = 'pending' order by review_id;")
+        return list(self._cursor)
+
+    def resolve(self, action, review_ids=None):
+        """Resolve pending records in one batch: insert them into the main table, ignore them, or replace the
+        existing record with them. Records that can't be replaced because they have more than one existing
+        record stay pending.
+
+        :param str action: 'insert', 'ignore' or 'replace'
+        :param list[int] review_ids: the records to resolve (default = all pending records)
+        :returns: the number of records resolved
+        :rtype: int
+        """
+        assert action in (INSERT, IGNORE, REPLACE), f"Cannot resolve review records with action '{action}'"
+        conditions = ["status = 'pending'"]
+        params = []
+        if review_ids is not None:
+            if not review_ids:
+                return 0
+            conditions.append(f"review_id in ({', '.join(['%s'] * len(review_ids))})")
+            params = list(review_ids)
+        if action == REPLACE:
+            conditions.append("existing_ids != '' and existing_ids not like '%%,%%'")
+            self._cursor.execute("DELETE m from main m join duplicate_review r on m.tran_ID = r.existing_ids where "
+                                 + ' and '.join(f"r.{condition}" for condition in conditions) + ';', params)
+        where = ' and '.join(conditions)
+        if action in (INSERT, REPLACE):
+            self._cursor.execute(f"INSERT into main ({self.MAIN_COLUMNS}) SELECT {self.MAIN_COLUMNS} from "
+                                 f"duplicate_review where {where};", params)
+        status = {INSERT: 'inserted', IGNORE: IGNORED, REPLACE: 'replaced'}[action]
+        self._cursor.execute(f"UPDATE duplicate_review set status = %s, resolved_at = NOW() where {where};",
+                             [status] + params)
+        return self._cursor.rowcount
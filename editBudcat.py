@@ -15,7 +15,7 @@ import WindowUtils
 import WindowList
 import globals
 
-from budgetQueries import BudgetDB
+from budgetQueries import BudgetDB, query_cleared_unrecorded_checks
 from editWindow import EditWindow
 from Window import ScreenWindow
 from mysettings import g
@@ -897,31 +897,25 @@ def do_query_cleared_unrecorded_checks():
 
     # tnum, tchecknum, tamt, tdate, tpayee, bud_cat, bud_amt, bud_date, comments, clear_date
     #  0       1        2      3       4       5        6        7         8          9
-    cur = bud_db.execute_query("select tran_checknum,tran_date,tran_amount from main where tran_checknum != '0' "
-                               "and tran_type = 'b' order by tran_checknum;")
     my_total = 0.0
 
-    # for every cleared CU check, see if it also exists as a transaction in the checks DATABASE, with at
-    # least an amount
-    for row in cur:
-        cur2 = bud_db.execute_query_2(f"select tchecknum from checks where tchecknum = '{str(row[0])}' and tamt is not "
-                                      f"null;")
-        if cur2.rowcount == 0:  # The row is a cleared, unrecorded check
-            check_entry = []
-            bud_array = list()
-            check_entry.append(None)  # tdate is None because the check's transaction date is not known at this time
-            check_entry.append(str(row[0]))  # tnum (varchar)
-            check_entry.append('')           # tpayee (varchar), unknown
-            check_entry.append(row[0])       # tchecknum (int)
-            check_entry.append('b')          # ttype
-            check_entry.append(row[2])       # tamt (decimal/float)
-            bud_array.append(['', row[2], None])
-            check_entry.append(bud_array)    # bud_array
-            check_entry.append('')           # comments (varchar), unknown
-            check_entry.append(row[1])  # clear_date is the main table's transaction date, the date it cleared the bank
-            elem_array.append(check_entry)
-            content_array.append(f"{row[0]:d} {row[1].strftime('%m/%d/%Y'):12s} {row[2]:7.2f}")
-            my_total += float(row[2])
+    # cleared CU checks that do not also exist as a transaction in the checks DATABASE with at least an amount
+    for row in query_cleared_unrecorded_checks(bud_db.cursor):
+        check_entry = []
+        bud_array = list()
+        check_entry.append(None)  # tdate is None because the check's transaction date is not known at this time
+        check_entry.append(str(row[0]))  # tnum (varchar)
+        check_entry.append('')           # tpayee (varchar), unknown
+        check_entry.append(row[0])       # tchecknum (int)
+        check_entry.append('b')          # ttype
+        check_entry.append(row[2])       # tamt (decimal/float)
+        bud_array.append(['', row[2], None])
+        check_entry.append(bud_array)    # bud_array
+        check_entry.append('')           # comments (varchar), unknown
+        check_entry.append(row[1])  # clear_date is the main table's transaction date, the date it cleared the bank
+        elem_array.append(check_entry)
+        content_array.append(f"{row[0]:d} {row[1].strftime('%m/%d/%Y'):12s} {row[2]:7.2f}")
+        my_total += float(row[2])
 
     return elem_array, content_array, my_total
 
@@ -1,9 +1,15 @@
 import os
 import json
 import re
+from collections import namedtuple
 from datetime import datetime
 
 
+# One failed check from RowValidator.validate_rows(). field_index is None if the row has the wrong number
+# of fields.
+ValidationFailure = namedtuple('ValidationFailure', ['line_num', 'field_index', 'value', 'message'])
+
+
 class FieldRule(object):
     """Object of field rules, including name.
 
@@ -60,6 +66,58 @@ class FieldRule(object):
         return f'{{ "name": "{self._name}", "data_type": "{self._data_type}", "regex": "{self._regex}" }}'
 
 
+class RowValidator(object):
+    """Validates data rows against a list of field rules, with the rule regexes compiled once.
+
+    Only the fields that are not 'freestr' are checked, so the per-row work is one precompiled match per
+    checked field.
+
+    :param list[FieldRule] fields: the field rules, in field order
+    """
+    def __init__(self, fields):
+        self._num_fields = len(fields)
+        self._checks = [(i, re.compile(field.regex), field.regex)
+                        for i, field in enumerate(fields) if field.data_type != "freestr"]
+
+    def validate(self, list_of_field_values):
+        """Assert that a row of field values is valid.
+
+        :param list[str] list_of_field_values: List of field values
+        """
+        assert len(list_of_field_values) == self._num_fields, (
+            f"The length of data fields {len(list_of_field_values)} is not the same as the number of expected fields "
+            f"{self._num_fields}")
+        for i, pattern, regex in self._checks:
+            assert pattern.match(list_of_field_values[i]), (
+                f"Field {i} value {list_of_field_values[i]} did not validate from regex {regex}")
+
+    def failures(self, list_of_field_values, line_num=None):
+        """Return every failed check of a row of field values.
+
+        :param list[str] list_of_field_values: List of field values
+        :param int line_num: the line number of the row, for the report (optional)
+        :rtype: list[ValidationFailure]
+        """
+        if len(list_of_field_values) != self._num_fields:
+            return [ValidationFailure(line_num, None, ','.join(list_of_field_values),
+                                      f"The length of data fields {len(list_of_field_values)} is not the same as "
+                                      f"the number of expected fields {self._num_fields}")]
+        return [ValidationFailure(line_num, i, list_of_field_values[i],
+                                  f"Field {i} value {list_of_field_values[i]} did not validate from regex {regex}")
+                for i, pattern, regex in self._checks if not pattern.match(list_of_field_values[i])]
+
+    def validate_rows(self, rows):
+        """Check all the rows and return every failure, instead of stopping at the first one.
+
+        :param Iterable[(int, list[str])] rows: (line number, field values) for each row
+        :rtype: list[ValidationFailure]
+        """
+        all_failures = []
+        for line_num, list_of_field_values in rows:
+            all_failures.extend(self.failures(list_of_field_values, line_num))
+        return all_failures
+
+
 class Header(object):
     """Create a header object.
 
@@ -69,6 +127,7 @@ class Header(object):
     def __init__(self, json_file=None, field_name_list=None):
         self._num_fields = 0
         self._fields = []
+        self._validator = None
 
         assert not (json_file and field_name_list), "Cannot provide both json_file and field_name_list"
         if json_file:
@@ -80,6 +139,7 @@ class Header(object):
                 else:
                     self._fields.append(FieldRule(field['name'], data_type=field['data_type']))
                 self._num_fields += 1
+            self._validator = RowValidator(self._fields)
         elif field_name_list:
             for field_name in field_name_list:
                 self._fields.append(FieldRule(field_name))
@@ -93,6 +153,16 @@ class Header(object):
     def fields(self):
         return self._fields
 
+    @property
+    def validator(self):
+        """The compiled data row validator, built from the current field rules
+
+        :rtype: RowValidator
+        """
+        if self._validator is None:
+            self._validator = RowValidator(self._fields)
+        return self._validator
+
     def validate_header_field_names(self, list_of_field_names):
         """Validate a list of field names against the rules.
 
@@ -110,20 +180,21 @@ class Header(object):
 
         :param list[str] list_of_field_values: List of field values
         """
-        assert len(list_of_field_values) == self._num_fields, (
-            f"The length of data fields {len(list_of_field_values)} is not the same as the number of expected fields "
-            f"{self._num_fields}")
-        for i in range(self._num_fields):
-            if self._fields[i].data_type == "freestr":
-                pass
-            else:
-                assert re.match(self._fields[i].regex, list_of_field_values[i]), (
-                    f"Field {i} value {list_of_field_values[i]} did not validate from regex {self._fields[i].regex}")
+        self.validator.validate(list_of_field_values)
+
+    def validate_data_rows(self, rows):
+        """Validate all the data rows against the rules and return every failure with its line number.
+
+        :param Iterable[(int, list[str])] rows: (line number, field values) for each row
+        :rtype: list[ValidationFailure]
+        """
+        return self.validator.validate_rows(rows)
 
     def edit_header(self):
         """Edit field rules for each field in header."""
         for field in self._fields:
             field.edit_field_rules()
+        self._validator = None  # rules may have changed
 
     def save_header(self, file_name):
         """Save off file_name to another file name, then overwrite file_name.
@@ -0,0 +1,112 @@
+"""Journal of the download file lines already written to the database"""
+
+import os
+import json
+import hashlib
+from utils import atomic_write
+
+
+def file_hash(file_name):
+    """Return the sha256 hash of the contents of a file
+
+    :param str file_name: the file to hash
+    :rtype: str
+    """
+    sha = hashlib.sha256()
+    with open(file_name, 'rb') as f_ptr:
+        for block in iter(lambda: f_ptr.read(1 << 16), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+class LineFingerprinter(object):
+    """Computes fingerprints of the data lines of one download file.
+
+    The fingerprint covers the tokenized fields, the comment, and how many identical lines came before it
+    in the file, so two genuinely identical transactions on the same day keep distinct fingerprints.
+    """
+    def __init__(self):
+        self._occurrences = {}
+
+    def fingerprint(self, fields, comment):
+        """Return the fingerprint of the next data line
+
+        :param list[str] fields: the fields of the line
+        :param str comment: the in-line comment of the line
+        :rtype: str
+        """
+        line = ','.join(fields) + comment
+        occurrence = self._occurrences.get(line, 0)
+        self._occurrences[line] = occurrence + 1
+        return hashlib.md5(f"{occurrence}:{line}".encode('utf-8')).hexdigest()
+
+
+class IngestJournal(object):
+    """Records, for each download file, the hash of its contents and the fingerprints of the data lines that
+    have been written to the database, so later runs can skip unchanged files and lines already seen.
+
+    Lines are staged while a file is converted and only committed to the journal after the file's records
+    have been committed to the database. Each file keeps the fingerprints of its current contents only, so the
+    journal stays the size of the download files.
+
+    :param str file_name: the name of the journal file
+    """
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self._files = dict()
+        self._staged = dict()
+        if os.path.exists(file_name):
+            with open(file_name, 'r') as f_ptr:
+                self._files = json.load(f_ptr)
+
+    def is_unchanged(self, download_file):
+        """Return True if the download file has the same contents as when it was last committed
+
+        :param str download_file: the download file name
+        :rtype: bool
+        """
+        entry = self._files.get(download_file)
+        return entry is not None and entry['sha256'] == file_hash(download_file)
+
+    def seen_lines(self, download_file):
+        """Return the fingerprints of the lines of the download file already written to the database
+
+        :param str download_file: the download file name
+        :rtype: set[str]
+        """
+        entry = self._files.get(download_file)
+        return set(entry['lines']) if entry else set()
+
+    def line_count(self, download_file):
+        """Return the number of lines of the download file already written to the database
+
+        :param str download_file: the download file name
+        :rtype: int
+        """
+        entry = self._files.get(download_file)
+        return len(entry['lines']) if entry else 0
+
+    def stage(self, download_file, new_lines):
+        """Stage the fingerprints of the lines of the download file
+
+        :param str download_file: the download file name
+        :param dict new_lines: the line fingerprints, mapped to the line's transaction ID, or to None if the
+            line was already in the journal
+        """
+        self._staged.setdefault(download_file, dict()).update(new_lines)
+
+    def commit(self, download_file, held_back_ids=()):
+        """Replace the journal's lines of the download file with its staged lines, except those whose records
+        were not written to the database, record its current contents hash, and save the journal
+
+        :param str download_file: the download file name
+        :param set[str] held_back_ids: the transaction IDs of the records that were not written (optional)
+        """
+        staged = self._staged.pop(download_file, dict())
+        lines = [fingerprint for fingerprint, transaction_id in staged.items()
+                 if transaction_id is None or transaction_id not in held_back_ids]
+        # A file with lines held back is not complete, so it is converted again even if it doesn't change
+        self._files[download_file] = {'sha256': file_hash(download_file) if len(lines) == len(staged) else '',
+                                      'lines': sorted(lines)}
+        with atomic_write(self.file_name) as f_ptr:
+            json.dump(self._files, f_ptr)
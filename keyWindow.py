@@ -0,0 +1,68 @@
+"""Transaction ID lookups against the main table without loading the whole history"""
+
+
+class WindowedKeySet(object):
+    """Set-like collection of the main table transaction IDs that only loads the IDs of records dated inside a
+    window, such as the date span of the download files plus a margin.
+
+    Keys outside the window are looked up in the database together with their '-0' split record forms, and
+    the answers are cached, so they still test correctly. Callers that know the keys they will test, such as
+    the transaction IDs of a download file, confirm them up front with confirm(), which looks up all the
+    unknown ones in a few batched queries. A key that was not confirmed is looked up on its own when tested.
+
+    :param pymysql.cursors.Cursor cursor: a database cursor used only by this object
+    :param datetime.date start_date: the first transaction date to load
+    :param datetime.date end_date: the last transaction date to load
+    """
+    # Most transaction IDs in one 'tran_ID in (...)' lookup
+    CONFIRM_BATCH_SIZE = 1000
+
+    def __init__(self, cursor, start_date, end_date):
+        self._cursor = cursor
+        self._cursor.execute('SELECT tran_ID from main where tran_date between %s and %s;', (start_date, end_date))
+        self._keys = set(row[0] for row in self._cursor)
+        self._confirmed = dict()
+        self.db_confirmations = 0
+        self.db_queries = 0
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        if key in self._keys:
+            return True
+        found = self._confirmed.get(key)
+        if found is None:
+            self.confirm((key,))
+            found = self._confirmed[key]
+        return found
+
+    def confirm(self, keys):
+        """Look up the keys that are neither in the window nor confirmed yet, and their split record forms, in
+        the database and cache the answers
+
+        :param Iterable[str] keys: the transaction IDs that will be tested
+        """
+        candidates = set()
+        for key in keys:
+            candidates.update((key, key + '-0'))
+            if key.endswith('-0'):
+                candidates.add(key[:-2])
+        unknown = sorted(key for key in candidates if key not in self._keys and key not in self._confirmed)
+        for start in range(0, len(unknown), self.CONFIRM_BATCH_SIZE):
+            batch = unknown[start:start + self.CONFIRM_BATCH_SIZE]
+            self._cursor.execute(f"SELECT tran_ID from main where tran_ID in ({', '.join(['%s'] * len(batch))});",
+                                 batch)
+            found = set(row[0] for row in self._cursor)
+            self.db_queries += 1
+            self.db_confirmations += len(batch)
+            for key in batch:
+                self._confirmed[key] = key in found
+            self._keys.update(found)
+
+    def local_keys(self):
+        """Return a copy of the keys held in memory, e.g. to hand to another process
+
+        :rtype: set[str]
+        """
+        return set(self._keys)
@@ -0,0 +1,65 @@
+"""Exact money arithmetic on amounts held as integer cents"""
+
+from decimal import Decimal, ROUND_HALF_UP
+
+CENT = Decimal('0.01')
+
+
+def parse_cents(amount):
+    """Return an amount in whole cents, rounded half away from zero
+
+    Plain '[-]d[.d[d]]' strings, which is what the download files hold, are parsed without going through
+    Decimal.
+
+    :param str|float|int|Decimal amount: the amount in dollars
+    :rtype: int
+    """
+    if isinstance(amount, str):
+        text = amount.strip()
+        sign = 1
+        if text[:1] in ('-', '+'):
+            sign = -1 if text[0] == '-' else 1
+            text = text[1:]
+        dollars, _, cents = text.partition('.')
+        if len(cents) <= 2 and (dollars or cents) and (not dollars or dollars.isdecimal()) \
+                and (not cents or cents.isdecimal()):
+            return sign * (int(dollars or '0') * 100 + int(cents.ljust(2, '0')))
+    return int(Decimal(str(amount)).quantize(CENT, rounding=ROUND_HALF_UP) * 100)
+
+
+def format_cents(cents):
+    """Return an amount in cents as a '[-]d.dd' dollar string
+
+    :param int cents: the amount in cents
+    :rtype: str
+    """
+    sign = '-' if cents < 0 else ''
+    dollars, remainder = divmod(abs(cents), 100)
+    return f"{sign}{dollars}.{remainder:02d}"
+
+
+def split_cents(total_cents, line_cents):
+    """Return the amounts of the budget lines of a split transaction.
+
+    The lines with an amount keep it, with the sign of the transaction amount when that is negative (budget
+    amounts are written as positive numbers). The first line without an amount gets whatever the other lines
+    leave of the transaction amount, so the lines add up to it exactly, and any further lines without an
+    amount get 0. If the given amounts are more than the transaction amount there is nothing left over, and
+    the line without an amount gets 0.
+
+    :param int total_cents: the transaction amount in cents
+    :param list[int|None] line_cents: the amount of each line in cents, or None if the line has none
+    :returns: the amount of each line in cents, and whether the given amounts are more than the total
+    :rtype: (list[int], bool)
+    """
+    negative = total_cents < 0
+    amounts = [cents if cents is None or not negative else -abs(cents) for cents in line_cents]
+    remainder = total_cents - sum(cents for cents in amounts if cents is not None)
+    over_assigned = remainder > 0 if negative else remainder < 0
+    if over_assigned:
+        remainder = 0
+    for i, cents in enumerate(amounts):
+        if cents is None:
+            amounts[i] = remainder
+            remainder = 0
+    return amounts, over_assigned
@@ -0,0 +1,150 @@
+"""Streaming reader for the transactions in OFX/QFX download files
+
+Handles both the SGML form of OFX 1.x, where element values are not closed:
+
+    <STMTTRN><TRNTYPE>CREDIT<DTPOSTED>20150203050000.000<TRNAMT>566.64<FITID>7514021503<NAME>PAYMENT</STMTTRN>
+
+and the XML form of OFX 2.x, where they are. The file is read in chunks and only the unparsed tail of the last
+chunk is held, so files of any size are read in bounded memory.
+"""
+
+import html
+import re
+from collections import namedtuple
+import money
+from downloadDates import parse_date
+
+CHUNK_SIZE = 64 * 1024
+# Longest run of text without a tag before the file is taken to not be OFX
+MAX_TEXT_LENGTH = 1024 * 1024
+# A TRNAMT with its digits grouped in threes, optionally followed by decimals after a '.' or ','
+GROUPED_AMOUNT = re.compile(r"([-+]?\d{1,3})((?:([,. '\u00a0])\d{3})(?:\3\d{3})*)([.,]\d*)?")
+
+# One STMTTRN of the download, normalized for the download conversion: tran_date is 'mm/dd/yyyy' and
+# amount_cents is the amount in cents. memo, trntype and check_num are '' if the transaction doesn't have them.
+OfxTransaction = namedtuple('OfxTransaction', ['tran_id', 'tran_date', 'amount_cents', 'tran_payee', 'memo',
+                                               'trntype', 'check_num'])
+
+
+class OfxFormatError(ValueError):
+    """An OFX/QFX file that cannot be read, or a transaction in it with a missing or bad field"""
+
+
+def iter_ofx_tags(file_ptr, chunk_size=CHUNK_SIZE):
+    """Yield the tags of an OFX/QFX file in order, as (tag, text) tuples. The tag is upper case and a closing
+    tag keeps its leading '/'. The text is the unescaped element value following an opening tag, or '' for
+    aggregates and closing tags. The SGML header, processing instructions and declarations are skipped.
+
+    :param file_ptr: the open file (anything with read(size))
+    :param int chunk_size: the number of characters to read at a time (default = 64K)
+    :rtype: Iterator[(str, str)]
+    """
+    buffer = ''
+    open_tag = None  # the last opening tag, whose text runs up to the next tag
+    while True:
+        chunk = file_ptr.read(chunk_size)
+        buffer += chunk
+        pos = 0
+        while True:
+            start = buffer.find('<', pos)
+            if start < 0:
+                break
+            end = buffer.find('>', start + 1)
+            if end < 0:
+                break
+            if open_tag is not None:
+                yield open_tag, html.unescape(buffer[pos:start].strip())
+                open_tag = None
+            name = buffer[start + 1:end].strip()
+            if name.startswith('/'):
+                yield name.upper(), ''
+            elif name and not name.startswith(('?', '!')):
+                open_tag = name.split()[0].upper()
+            pos = end + 1
+        buffer = buffer[pos:]
+        if not chunk:
+            break
+        if len(buffer) > MAX_TEXT_LENGTH:
+            raise OfxFormatError(f"No OFX tag in {len(buffer)} characters; this does not look like an OFX file")
+    if open_tag is not None:
+        yield open_tag, html.unescape(buffer.strip())
+
+
+def _normalize_amount(amount):
+    """Return a TRNAMT with a '.' decimal point and no grouping separators. Some banks write the amount with a
+    decimal comma, or group the digits, e.g. '-1,234.50', '-1.234,50' or '1 234,50'. An amount that is not
+    grouped in threes is returned as is, for money.parse_cents to accept or reject.
+
+    :param str amount: the TRNAMT value
+    :rtype: str
+    """
+    amount = amount.strip()
+    match = GROUPED_AMOUNT.fullmatch(amount)
+    if match:
+        lead, groups, separator, decimals = match.groups()
+        # A single '.' group with no decimals is a decimal point with three places, not grouping
+        if separator != (decimals or ' ')[0] and not (separator == '.' and not decimals and groups.count('.') == 1):
+            return lead + groups.replace(separator, '') + ('.' + decimals[1:] if decimals else '')
+    if amount.count(',') == 1 and '.' not in amount:
+        return amount.replace(',', '.')
+    return amount
+
+
+def _make_transaction(fields, number):
+    """Return the normalized transaction of the fields of a STMTTRN
+
+    :param dict fields: the values of the tags in the STMTTRN
+    :param int number: the position of the transaction in the file, for error messages
+    :rtype: OfxTransaction
+    """
+    missing = [tag for tag in ('FITID', 'DTPOSTED', 'TRNAMT', 'NAME') if not fields.get(tag)]
+    if missing:
+        raise OfxFormatError(f"Transaction {number} is missing {', '.join(missing)}: {fields}")
+
+    # DTPOSTED is yyyymmdd, optionally followed by the time and time zone
+    posted = fields['DTPOSTED']
+    tran_date = f"{posted[4:6]}/{posted[6:8]}/{posted[:4]}"
+    try:
+        if not posted[:8].isdigit():
+            raise ValueError(posted)
+        parse_date(tran_date)
+    except ValueError:
+        raise OfxFormatError(f"Transaction {number} has a bad DTPOSTED '{posted}'") from None
+
+    try:
+        amount_cents = money.parse_cents(_normalize_amount(fields['TRNAMT']))
+    except ArithmeticError:
+        raise OfxFormatError(f"Transaction {number} has a bad TRNAMT '{fields['TRNAMT']}'") from None
+
+    return OfxTransaction(fields['FITID'], tran_date, amount_cents, fields['NAME'], fields.get('MEMO', ''),
+                          fields.get('TRNTYPE', ''), fields.get('CHECKNUM', ''))
+
+
+def iter_ofx_transactions(file_ptr, chunk_size=CHUNK_SIZE):
+    """Yield the transactions of an OFX/QFX file as they are read
+
+    The value of each tag is the first one in the STMTTRN, so a NAME in a PAYEE aggregate is used if the
+    transaction has no NAME of its own.
+
+    :param file_ptr: the open file (anything with read(size))
+    :param int chunk_size: the number of characters to read at a time (default = 64K)
+    :raises OfxFormatError: if a transaction is not closed or has a missing or bad field
+    :rtype: Iterator[OfxTransaction]
+    """
+    fields = None
+    number = 0
+    for tag, text in iter_ofx_tags(file_ptr, chunk_size):
+        if tag == 'STMTTRN':
+            if fields is not None:
+                raise OfxFormatError(f"Transaction {number} is not closed before the next <STMTTRN>")
+            fields = dict()
+            number += 1
+        elif tag == '/STMTTRN':
+            if fields is None:
+                raise OfxFormatError(f"</STMTTRN> after transaction {number} has no <STMTTRN>")
+            yield _make_transaction(fields, number)
+            fields = None
+        elif fields is not None and text:
+            fields.setdefault(tag, text)
+    if fields is not None:
+        raise OfxFormatError(f"Transaction {number} is not closed at the end of the file")
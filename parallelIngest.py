@@ -0,0 +1,77 @@
+"""Convert download files in parallel worker processes"""
+
+from concurrent.futures import ProcessPoolExecutor
+import transferFilesToDB
+import transfer_downloads_to_db
+from utils import Logger, INFO
+from stageTimer import StageTimer
+
+# Each worker process builds its own payee lookup object and logger, and gets the known keys, once in
+# _init_worker()
+_worker_transfer = None
+_worker_logger = None
+_worker_known_keys = None
+
+
+def _init_worker(log_file_name, log_level, known_keys):
+    """Set up the worker process. The database cursor is not needed to look up payee categories.
+
+    :param str log_file_name: the log file to append the worker's log messages to
+    :param int log_level: the lowest level of the messages to log
+    :param set known_keys: transaction IDs already in the database, or None
+    """
+    global _worker_transfer, _worker_logger, _worker_known_keys
+    _worker_logger = Logger(log_file_name, print_to_console=False, append=True, level=log_level)
+    _worker_transfer = transferFilesToDB.TransferMonthlyFilesToDB(None, _worker_logger)
+    _worker_known_keys = known_keys
+
+
+def _convert_in_worker(download_file, map_file, format_file, key, seen_lines, do_stats):
+    """Parse, validate and categorize one download file in a worker process
+
+    :param str download_file: name of the download file
+    :param str map_file: name of the map file
+    :param str format_file: name of the format file
+    :param str key: identifying key in map file
+    :param set seen_lines: ingest journal fingerprints of lines to skip, or None
+    :param bool do_stats: time the conversion stages
+    :returns: the converted records, the run statistics, the line fingerprints with their transaction IDs, the
+        stage timer or None, and the category cache updates
+    :rtype: (dict, dict, dict, StageTimer, (list[list[str]], int, int))
+    """
+    counters = {}
+    new_lines = dict()
+    timer = StageTimer() if do_stats else None
+    output_dict = transfer_downloads_to_db.convert_downloads_file(
+        download_file, map_file, format_file, key, _worker_transfer, _worker_logger, known_keys=_worker_known_keys,
+        counters=counters, seen_lines=seen_lines, new_lines=new_lines, timer=timer)
+    _worker_logger.flush()
+    return output_dict, counters, new_lines, timer, _worker_transfer.category_cache.take_updates()
+
+
+def convert_downloads_in_parallel(jobs, log_file_name, known_keys=None, max_workers=None, do_stats=False,
+                                  log_level=INFO):
+    """Run convert_downloads_file() for each job in a pool of worker processes.
+
+    Only parsing, validation and categorization happen in the workers. The results come back in job order
+    so the caller can write them to the database from a single process, in whatever order it requires. Each
+    worker's category cache starts from the saved cache file; the categories it looks up come back with the
+    results, for the caller to merge into its own cache and save.
+
+    :param list[(str, str, str, str, set)] jobs: (download file, map file, format file, map key, ingest journal
+        fingerprints of lines to skip or None) for each file
+    :param str log_file_name: the log file the workers append to
+    :param set known_keys: transaction IDs already in the database (optional)
+    :param int max_workers: the number of worker processes (default = number of CPUs)
+    :param bool do_stats: time the conversion stages in the workers (default = False)
+    :param int log_level: the lowest level of the workers' log messages to log (default = INFO)
+    :returns: (converted records, run statistics, line fingerprints with their transaction IDs, stage timer or
+        None, category cache updates) for each job, in job order
+    :rtype: list[(dict, dict, dict, StageTimer, (list[list[str]], int, int))]
+    """
+    if not jobs:
+        return []
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                             initargs=(log_file_name, log_level, known_keys)) as executor:
+        futures = [executor.submit(_convert_in_worker, *job, do_stats) for job in jobs]
+        return [future.result() for future in futures]
@@ -0,0 +1,167 @@
+"""Compiled matcher for the regular expressions in the payee file"""
+
+import re
+import bisect
+import calendar
+import datetime
+
+
+class CategoryTimeline(object):
+    """The budget categories of one payee rule over time, parsed once from the payee file.
+
+    format examples: cat
+                     cat1,yyyymm1;cat2,yyyymm2;...;catN
+    Each dated category applies up to and including the last day of its month. The assumption is that
+    each succeeding date is later than the preceding ones and that the last, undated category applies to
+    all later dates. If every category is dated, the rule does not apply after the last date.
+
+    :param str categories: the category string of the payee rule
+    """
+    def __init__(self, categories):
+        self._cutoffs = []
+        self._categories = []
+        self._final = None
+
+        cats = categories.split(';')
+        if len(cats) == 1:
+            self._final = cats[0]
+            return
+        for cat in cats:
+            parts = cat.split(',')
+            if len(parts) != 2:
+                # the first undated category is the most recent, anything after it is never reached
+                self._final = cat
+                break
+            year, month = int(parts[1][:4]), int(parts[1][4:6])
+            cutoff = datetime.date(year, month, calendar.monthrange(year, month)[1]).toordinal()
+            # A category whose cutoff is not later than an earlier one is never reached by an in-order
+            # search, so dropping it keeps the cutoffs sorted without changing any result.
+            if self._cutoffs and cutoff <= self._cutoffs[-1]:
+                continue
+            self._cutoffs.append(cutoff)
+            self._categories.append(parts[0])
+
+    def to_state(self):
+        """Return the parsed timeline as json-compatible data for from_state()
+
+        :rtype: list
+        """
+        return [self._cutoffs, self._categories, self._final]
+
+    @classmethod
+    def from_state(cls, state):
+        """Return the timeline of the data from to_state(), without parsing the category string again
+
+        :param list state: the parsed timeline
+        :rtype: CategoryTimeline
+        """
+        timeline = cls.__new__(cls)
+        timeline._cutoffs, timeline._categories, timeline._final = state
+        return timeline
+
+    def category_for(self, ordinal):
+        """Return the category in effect on the given day, or None if the rule no longer applies.
+
+        :param int ordinal: the day as a proleptic Gregorian ordinal
+        :rtype: str|None
+        """
+        i = bisect.bisect_left(self._cutoffs, ordinal)
+        if i < len(self._cutoffs):
+            return self._categories[i]
+        return self._final
+
+
+class PayeeMatcher(object):
+    """Match a payee string against all the payee file regexes at once.
+
+    All of the payee regexes are compiled into a single alternation regex, one named group per rule,
+    in payee file line order. Python's regex engine tries the alternatives left to right, so the
+    first alternative that matches is the same rule that a line-by-line scan would have found first.
+    If the combined regex cannot be built (a rule uses a construct that is only legal at the start of
+    a pattern, for instance), matching falls back to scanning the individually compiled rules.
+
+    :param dict payee_dict: the payee dictionary as returned by TransferPayee.read_payee_file()
+    """
+    GROUP_PREFIX = '_payee'
+
+    def __init__(self, payee_dict):
+        # rules are keyed by payee file line number, so sorting the keys keeps the line order
+        self._rules = [payee_dict[key] for key in sorted(payee_dict)]
+        # the individual rules are only compiled when the fallback scan first needs them
+        self._patterns = None
+        self._timelines = [CategoryTimeline(rule[1]) for rule in self._rules]
+
+        self._combined = None
+        self._combined_source = None
+        self._group_to_rule = {}
+        combined_source = '|'.join(f'(?P<{self.GROUP_PREFIX}{i}>{rule[0]})' for i, rule in enumerate(self._rules))
+        try:
+            combined = re.compile(combined_source, re.I)
+        except re.error:
+            return
+        for name, group_index in combined.groupindex.items():
+            if name.startswith(self.GROUP_PREFIX):
+                self._group_to_rule[group_index] = int(name[len(self.GROUP_PREFIX):])
+        self._combined = combined
+        self._combined_source = combined_source
+
+    def to_state(self):
+        """Return the compiled matcher as json-compatible data for from_state(): the rules, the parsed
+        timelines, and the combined regex source with its group to rule map
+
+        :rtype: dict
+        """
+        return {'rules': self._rules,
+                'timelines': [timeline.to_state() for timeline in self._timelines],
+                'combined_source': self._combined_source,
+                'group_to_rule': sorted(self._group_to_rule.items())}
+
+    @classmethod
+    def from_state(cls, state):
+        """Return the matcher of the data from to_state(). Only the combined regex is compiled.
+
+        :param dict state: the compiled matcher data
+        :rtype: PayeeMatcher
+        """
+        matcher = cls.__new__(cls)
+        matcher._rules = state['rules']
+        matcher._patterns = None
+        matcher._timelines = [CategoryTimeline.from_state(timeline) for timeline in state['timelines']]
+        matcher._combined_source = state['combined_source']
+        matcher._combined = (None if matcher._combined_source is None
+                             else re.compile(matcher._combined_source, re.I))
+        matcher._group_to_rule = {group_index: rule for group_index, rule in state['group_to_rule']}
+        return matcher
+
+    @property
+    def rules(self):
+        return self._rules
+
+    @property
+    def timelines(self):
+        return self._timelines
+
+    @property
+    def is_combined(self):
+        return self._combined is not None
+
+    def match(self, payee, start=0):
+        """Return the index of the first rule, at or after rule index start, whose regex matches the
+        payee string, or None if there is no match.
+
+        :param str payee: the payee string
+        :param int start: the index of the first rule to try (default = 0)
+        :rtype: int|None
+        """
+        if start == 0 and self._combined is not None:
+            match_object = self._combined.match(payee)
+            if match_object is None:
+                return None
+            return self._group_to_rule[match_object.lastindex]
+
+        if self._patterns is None:
+            self._patterns = [re.compile(rule[0], re.I) for rule in self._rules]
+        for i in range(start, len(self._patterns)):
+            if self._patterns[i].match(payee):
+                return i
+        return None
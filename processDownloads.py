@@ -8,14 +8,26 @@ import os
 import inspect
 import traceback
 import pymysql
+import budgetQueries
 import transfer_cu_files
 import transfer_citi_files
 import transfer_discover_files
 import transferFilesToDB
 import transfer_downloads_to_db
+import downloadFormats
+import parallelIngest
+from ingestJournal import IngestJournal
+from keyWindow import WindowedKeySet
+from stageTimer import StageTimer, NULL_TIMER
 import utils
 from utils import Logger
 import globals
+from duplicateIndex import DuplicateIndex
+from transaction import Transaction
+from downloadDates import format_date, parse_date
+from money import format_cents
+import duplicatePolicy
+from duplicatePolicy import DuplicatePolicy, ReviewQueue
 
 
 class ProcessDownloads(object):
@@ -23,9 +35,31 @@ class ProcessDownloads(object):
     CK_FILE = 'downloads/checks'
     DI_FILE = 'downloads/Discover-RecentActivity.csv'
     CI_FILE = 'downloads/Citi-RecentActivity.csv'
-
-    def __init__(self, do_insert=True, do_validate=False):
-        self.logger = Logger('process_download_log', append=True, print_to_console=True)
+    LOG_FILE = 'process_download_log'
+    MAP_FILE = 'map_download_to_db.json'
+    JOURNAL_FILE = 'ingest_journal.json'
+    STATS_FILE = 'process_download_stats.json'
+    DUPLICATE_POLICY_FILE = 'duplicate_policy.json'
+
+    # Days either side of the download files' date span to prefetch main table keys for in windowed mode
+    KEY_WINDOW_MARGIN_DAYS = 14
+    # The check reports start with the checks of 2006
+    CHECKS_REPORT_START_DATE = datetime.date(2006, 1, 1)
+
+    # Download files in the order their records must be written to the database
+    SOURCES = [('discover', DI_FILE), ('cu', CU_FILE), ('citi', CI_FILE)]
+
+    # All-placeholder VALUES lets pymysql's executemany() send one multi-row INSERT per batch
+    INSERT_MAIN_QUERY = ('INSERT into main (tran_date,tran_ID,tran_desc,tran_checknum,tran_type,tran_amount,'
+                         'bud_category,bud_amount,bud_date,comment) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)')
+    INSERT_CHECKS_QUERY = ('INSERT into checks (tnum,tchecknum,tamt,tdate,tpayee,bud_cat,bud_amt,bud_date,comments) '
+                           'VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)')
+
+    def __init__(self, do_insert=True, do_validate=False, do_parallel=False, do_windowed_keys=False,
+                 do_stats=False, do_debug=False, unattended=False):
+        # Per-transaction trace messages are only logged in debug mode
+        self.logger = Logger(self.LOG_FILE, append=True, print_to_console=True,
+                             level=(utils.DEBUG if do_debug else utils.INFO))
 
         # Open a connection to the DATABASE
         self.db = pymysql.connect(host='localhost', user='root', passwd=globals.DB_PASSWORD, db=globals.DB_NAME)
@@ -33,8 +67,27 @@ class ProcessDownloads(object):
         self.db_cursor2 = self.db.cursor()
 
         self.records_inserted = 0
+        self.counters = {'already_in_db': 0, 'skipped_by_journal': 0}
         self.DO_INSERT = do_insert
         self.DO_VALIDATE = do_validate
+        self.DO_PARALLEL = do_parallel
+        self.DO_WINDOWED_KEYS = do_windowed_keys
+
+        # Per-stage timing of the conversion and insert. The null timer makes the timing calls free when off.
+        self.timer = StageTimer() if do_stats else NULL_TIMER
+
+        # Possible duplicate records are resolved by the policy where it can, so unattended runs never wait on
+        # the user. Records it holds back are queued for review with each download file's inserts.
+        self.duplicate_policy = DuplicatePolicy.load(self.DUPLICATE_POLICY_FILE, unattended=unattended)
+        self.review_queue = ReviewQueue(self.db_cursor1)
+        self.review_rows = []
+        self.review_statuses = dict()
+        self.records_queued = 0
+        # Transaction IDs of the download lines whose records were held back for review instead of written
+        self.held_back_ids = set()
+
+        # The ingest journal is not used when validating, which needs the complete dictionaries to compare
+        self.journal = None if do_validate else IngestJournal(self.JOURNAL_FILE)
 
     def _setup(self):
         # Verify all downloads files exist
@@ -50,23 +103,44 @@ class ProcessDownloads(object):
         self.db.close()
         self.logger.log('Shutting down...')
 
-    def execute_cursor1(self, query_string):
+    def execute_cursor1(self, query_string, params=None):
         try:
-            self.db_cursor1.execute(query_string)
+            self.db_cursor1.execute(query_string, params)
         except pymysql.Error as sqlexc:
             self.logger.log(f"{inspect.stack()[1][3]}(): Exception executing query: {query_string}")
             self.global_exception_printer(f"{sqlexc}")
             sys.exit(1)
 
-    def execute_cursor2(self, query_string):
+    def execute_cursor2(self, query_string, params=None):
         try:
-            self.db_cursor2.execute(query_string)
+            self.db_cursor2.execute(query_string, params)
         except pymysql.Error as sqlexc:
             # (exception_type, value, tb) = sys.exc_info()
             self.logger.log(f"{inspect.stack()[1][3]}(): Exception executing query: {query_string}")
             self.global_exception_printer(f"{sqlexc}")
             sys.exit(1)
 
+    def execute_many_in_transaction(self, query_string, rows, *more_batches):
+        """Execute the parameterized query once for each row and commit them all together. Roll back and
+        exit on error, so either all of the rows are written or none of them are.
+
+        :param str query_string: the query with %s placeholders
+        :param list[tuple] rows: the parameters for each execution
+        :param (str, list[tuple]) more_batches: more (query, rows) to execute in the same transaction
+        """
+        try:
+            for query_string, rows in ((query_string, rows),) + more_batches:
+                if rows:
+                    self.db_cursor1.executemany(query_string, rows)
+            self.db.commit()
+        except pymysql.Error as sqlexc:
+            self.db.rollback()
+            self.logger.log(f"{inspect.stack()[1][3]}(): Exception executing query for {len(rows)} rows: "
+                            f"{query_string}")
+            self.logger.log(f"{sqlexc}")
+            self.logger.log("Rolled back all changes for this download file")
+            sys.exit(1)
+
     def _dicts_are_same(self, dict1, dict2):
         """Verify the two dictionaries are the same.
         
@@ -85,60 +159,237 @@ class ProcessDownloads(object):
             self.logger.log(f"dict1 keys are not equal to dict2 keys:\n{keys1} vs \n{keys2}")
             return False
         for key in keys1:
-            if not (isinstance(dict1[key], list) and isinstance(dict2[key], list)):
-                self.logger.log(f"Expected both dicts values to be lists, but they are not.")
+            if not (isinstance(dict1[key], Transaction) and isinstance(dict2[key], Transaction)):
+                self.logger.log(f"Expected both dicts values to be Transaction records, but they are not.")
                 return False
-            list1 = [v for v in dict1[key]]
-            list2 = [v for v in dict2[key]]
+            list1 = dict1[key].as_list()
+            list2 = dict2[key].as_list()
             if list1 != list2:
                 self.logger.log(f"values of dicts[{key}] are not the same:\n{list1} vs\n{list2}")
                 return False
         return True
 
+    def _needs_converting(self, download_file):
+        """Return True if the download file exists and has changed since it was last written to the database
+
+        :param str download_file: name of the download file
+        :rtype: bool
+        """
+        if not os.path.isfile(download_file):
+            return False
+        if self.journal is not None and self.journal.is_unchanged(download_file):
+            skipped = self.journal.line_count(download_file)
+            self.logger.log(f"\n**** {download_file} is unchanged since it was last processed: skipped {skipped} "
+                            "lines ****\n")
+            self.counters['skipped_by_journal'] += skipped
+            return False
+        return True
+
+    def _convert_download_file(self, download_file, key, transfer, known_keys, converted):
+        """Return the converted records of a download file, either already converted in parallel or converted
+        here. Lines already in the ingest journal are skipped and the rest are staged in it.
+
+        :param str download_file: name of the download file
+        :param str key: identifying key in the map file
+        :param transferFilesToDB.TransferMonthlyFilesToDB transfer: the payee lookup object
+        :param set known_keys: transaction IDs already in the database, or None
+        :param dict converted: records already converted by the parallel stage, by download file name
+        :rtype: dict
+        """
+        if download_file in converted:
+            return converted[download_file]
+        seen_lines = None if self.journal is None else self.journal.seen_lines(download_file)
+        new_lines = dict()
+        output_dict = transfer_downloads_to_db.convert_downloads_file(
+            download_file, self.MAP_FILE, f"{key}_download_format.json", key, transfer, self.logger,
+            known_keys=known_keys, counters=self.counters, seen_lines=seen_lines, new_lines=new_lines,
+            timer=self.timer)
+        if self.journal is not None:
+            self.journal.stage(download_file, new_lines)
+        return output_dict
+
+    def _convert_in_parallel(self, to_convert, transfer, known_keys):
+        """Parse, validate and categorize all the download files at once in worker processes. The categories the
+        workers look up are merged into the payee lookup object's category cache.
+
+        :param list[str] to_convert: the download files to convert
+        :param transferFilesToDB.TransferMonthlyFilesToDB transfer: the payee lookup object
+        :param set known_keys: transaction IDs already in the database, or None
+        :returns: the converted records by download file name
+        :rtype: dict
+        """
+        jobs = [(download_file, self.MAP_FILE, f"{key}_download_format.json", key,
+                 None if self.journal is None else self.journal.seen_lines(download_file))
+                for key, download_file in self.SOURCES if download_file in to_convert]
+        self.logger.log(f"\n**** converting {len(jobs)} download files in parallel... ****\n")
+        results = parallelIngest.convert_downloads_in_parallel(jobs, self.LOG_FILE, known_keys=known_keys,
+                                                               do_stats=self.timer.enabled,
+                                                               log_level=self.logger.level)
+
+        converted = dict()
+        for job, (output_dict, counters, new_lines, timer, cache_updates) in zip(jobs, results):
+            converted[job[0]] = output_dict
+            transfer.category_cache.merge(*cache_updates)
+            if timer is not None:
+                self.timer.merge(timer.stages, timer.counts)
+            for counter, value in counters.items():
+                self.counters[counter] = self.counters.get(counter, 0) + value
+            if self.journal is not None:
+                self.journal.stage(job[0], new_lines)
+        return converted
+
+    def _duplicate_window_days(self, key):
+        """Return the duplicate_window_days of the download source's field map (0 if not set)
+
+        :param str key: identifying key in the map file
+        :rtype: int
+        """
+        return downloadFormats.get_source(key, map_file=self.MAP_FILE).field_map.get('duplicate_window_days', 0)
+
+    def _commit_journal(self, download_file):
+        """Record the download file's staged lines in the ingest journal once its records are in the database.
+        Nothing is recorded when inserting is disabled, and lines whose records were held back for duplicate
+        review are left out so they are processed again.
+
+        :param str download_file: name of the download file
+        """
+        if self.journal is not None and self.DO_INSERT:
+            self.journal.commit(download_file, self.held_back_ids)
+
+    def _load_windowed_keys(self):
+        """Return the main table keys of the records dated within the download files' date span plus a margin.
+        Keys outside the window are confirmed against the database on demand.
+
+        :rtype: WindowedKeySet
+        """
+        date_ranges = []
+        for key, download_file in self.SOURCES:
+            if os.path.isfile(download_file):
+                date_range = transfer_downloads_to_db.download_date_range(download_file, self.MAP_FILE, key)
+                if date_range:
+                    date_ranges.append(date_range)
+        margin = datetime.timedelta(days=self.KEY_WINDOW_MARGIN_DAYS)
+        if date_ranges:
+            start_date = min(first for first, _ in date_ranges) - margin
+            end_date = max(last for _, last in date_ranges) + margin
+        else:
+            start_date = end_date = datetime.date.today()
+        try:
+            db_keys = WindowedKeySet(self.db.cursor(), start_date, end_date)
+        except pymysql.Error as sqlexc:
+            self.logger.log(f"_load_windowed_keys(): Exception loading main keys: {sqlexc}")
+            sys.exit(1)
+        self.logger.log(f"Loaded {len(db_keys)} main keys dated {start_date} to {end_date}")
+        return db_keys
+
+    def _save_stats(self, converted_files):
+        """Write the stage timings and run counters to the stats file next to the log file
+
+        :param list[str] converted_files: the download files that were converted
+        """
+        try:
+            self.timer.save(self.STATS_FILE, run_at=datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                            files=converted_files, parallel=self.DO_PARALLEL,
+                            records_inserted=self.records_inserted, counters=self.counters)
+        except OSError as exc:
+            self.logger.log(f"Could not write stats file {self.STATS_FILE}: {exc}")
+            return
+        self.logger.log(f"Wrote stage timings to {self.STATS_FILE}")
+
+    def _load_review_queue(self):
+        """Create the duplicate review table if needed, and load the transaction IDs already waiting in it or
+        ignored there. A dry run doesn't create the table.
+        """
+        try:
+            if self.DO_INSERT:
+                self.review_queue.ensure_table()
+            self.review_statuses = self.review_queue.queued_ids()
+        except pymysql.Error as sqlexc:
+            if self.DO_INSERT:
+                self.logger.log(f"_load_review_queue(): Exception loading the duplicate review queue: {sqlexc}")
+                sys.exit(1)
+            self.review_statuses = dict()  # no review table yet
+        num_pending = sum(1 for status in self.review_statuses.values() if status == duplicatePolicy.PENDING)
+        if num_pending:
+            self.logger.log(f"{num_pending} records are waiting in the duplicate review queue")
+
     def execute(self):
         self._setup()
+        self._load_review_queue()
 
         # store the list of main DB and checks keys for quick searching
-        self.execute_cursor1('SELECT tran_ID from main;')
-        db_keys = set(row[0] for row in self.db_cursor1)
+        if self.DO_WINDOWED_KEYS:
+            # only the keys near the download files' dates, so startup doesn't grow with the history
+            db_keys = self._load_windowed_keys()
+        else:
+            self.execute_cursor1('SELECT tran_ID from main;')
+            db_keys = set(row[0] for row in self.db_cursor1)
+
+            self.execute_cursor1('SELECT tnum from checks;')
+            ck_keys = set(row[0] for row in self.db_cursor1)
+
+        transfer = transferFilesToDB.TransferMonthlyFilesToDB(self.db_cursor1, self.logger,
+                                                              dump_payees=self.logger.is_enabled_for(utils.DEBUG))
 
-        self.execute_cursor1('SELECT tnum from checks;')
-        ck_keys = set(row[0] for row in self.db_cursor1)
+        # Skip rows already in the database as early as possible, except when validating against the old way
+        # of processing, which needs the complete dictionaries to compare.
+        known_keys = None if self.DO_VALIDATE else db_keys
+        # In windowed mode the conversion only skips the rows whose keys are held in memory. The rows it doesn't
+        # skip are checked against the database with one batched lookup per file before inserting.
+        if isinstance(known_keys, WindowedKeySet):
+            known_keys = known_keys.local_keys()
 
-        transfer = transferFilesToDB.TransferMonthlyFilesToDB(self.db_cursor1, self.logger)
+        # Only download files that exist and changed since they were last processed need converting
+        to_convert = [download_file for _, download_file in self.SOURCES if self._needs_converting(download_file)]
 
-        if os.path.isfile(self.DI_FILE):
+        # In parallel mode, all the files are converted up front. The database writes below stay in a single
+        # process, in the required order: Discover, CU, clear CU checks, then Citi.
+        converted = self._convert_in_parallel(to_convert, transfer, known_keys) if self.DO_PARALLEL else dict()
+
+        if self.DI_FILE in to_convert:
             self.logger.log('\n**** processing Discover download file... ****\n')
-            t_dict_newway = transfer_downloads_to_db.convert_downloads_file(
-                self.DI_FILE, "map_download_to_db.json", "discover_download_format.json", "discover", transfer,
-                self.logger)
+            t_dict_newway = self._convert_download_file(self.DI_FILE, "discover", transfer, known_keys, converted)
             if self.DO_VALIDATE:
                 t_dict_oldway = transfer_discover_files.read_monthly_discover_file(self.DI_FILE, transfer, self.logger)
                 assert self._dicts_are_same(t_dict_newway, t_dict_oldway), "Discover transfer dicts DO NOT MATCH"
-            self.insert_dict_into_main_db(t_dict_newway, db_keys)
+            self.insert_dict_into_main_db(t_dict_newway, db_keys, window_days=self._duplicate_window_days("discover"))
+            self._commit_journal(self.DI_FILE)
 
-        if os.path.isfile(self.CU_FILE):  # process cleared transactions second
+        if self.CU_FILE in to_convert:  # process cleared transactions second
             self.logger.log('\n**** processing credit union download file... ****\n')
-            t_dict_newway = transfer_downloads_to_db.convert_downloads_file(
-                self.CU_FILE, "map_download_to_db.json", "cu_download_format.json", "cu", transfer, self.logger)
+            t_dict_newway = self._convert_download_file(self.CU_FILE, "cu", transfer, known_keys, converted)
             if self.DO_VALIDATE:
                 t_dict_oldway = transfer_cu_files.read_monthly_cu_file(self.CU_FILE, transfer, self.logger)
                 assert self._dicts_are_same(t_dict_newway, t_dict_oldway), "CU transfer dicts DO NOT MATCH"
-            self.insert_dict_into_main_db(t_dict_newway, db_keys)
+            self.insert_dict_into_main_db(t_dict_newway, db_keys, window_days=self._duplicate_window_days("cu"))
+            self._commit_journal(self.CU_FILE)
 
         self.clear_cu_checks()  # mark cleared checks
 
-        if os.path.isfile(self.CI_FILE):
+        if self.CI_FILE in to_convert:
             self.logger.log('\n**** processing CitiCard download file... ****\n')
-            t_dict_newway = transfer_downloads_to_db.convert_downloads_file(
-                self.CI_FILE, "map_download_to_db.json", "citi_download_format.json", "citi", transfer, self.logger)
+            t_dict_newway = self._convert_download_file(self.CI_FILE, "citi", transfer, known_keys, converted)
             if self.DO_VALIDATE:
                 t_dict_oldway = transfer_citi_files.read_monthly_citi_file(self.CI_FILE, transfer, self.logger)
                 assert self._dicts_are_same(t_dict_newway, t_dict_oldway), "Citi transfer dicts DO NOT MATCH"
-            self.insert_dict_into_main_db(t_dict_newway, db_keys)
+            self.insert_dict_into_main_db(t_dict_newway, db_keys, window_days=self._duplicate_window_days("citi"))
+            self._commit_journal(self.CI_FILE)
+
+        transfer.save_category_cache()
 
         self.logger.log(f"\n{('Inserted ' if self.DO_INSERT else 'INSERT DISABLED: Would have inserted ')}"
                         f"{self.records_inserted} records into DB")
+        self.logger.log(f"Skipped {self.counters['already_in_db']} downloaded records already in DB")
+        if self.records_queued:
+            self.logger.log(f"Queued {self.records_queued} possible duplicate records for review. "
+                            "Run 'python3 reviewDuplicates.py' to resolve them.")
+        self.logger.log(f"Skipped {self.counters['skipped_by_journal']} download file lines already processed "
+                        "according to the ingest journal")
+        if self.DO_WINDOWED_KEYS:
+            self.logger.log(f"Confirmed {db_keys.db_confirmations} keys outside the prefetch window with "
+                            f"{db_keys.db_queries} DB queries")
+        if self.timer.enabled:
+            self._save_stats(to_convert)
 
         self.print_uncleared_checks()
         self.print_unrecorded_checks()
@@ -159,19 +410,16 @@ class ProcessDownloads(object):
         self.logger.log("**********************************")
 
     def clear_cu_checks(self):
-        """Runs query to identify main table check entries and attempt to clear them"""
-        updated = 0
-        local_query = "select tran_checknum,tran_date from main where tran_checknum != '0' and tran_type = 'b';"
-        self.execute_cursor1(local_query)
+        """Set the clear date of recorded checks that have cleared the credit union since the last run.
 
-        for inner_row in self.db_cursor1:
-            check_num = str(inner_row[0])
-            transaction_date = inner_row[1]
-
-            local_query = f"update checks set clear_date = '{transaction_date}' where tchecknum = '{check_num}';"
-            self.execute_cursor2(local_query)
-
-            updated += 1
+        One set-based update joins the checks table to the cleared CU checks in the main table, touching only
+        checks that are not marked cleared yet.
+        """
+        local_query = ("update checks c join main m on c.tchecknum = m.tran_checknum "
+                       "set c.clear_date = m.tran_date "
+                       "where c.clear_date is null and m.tran_checknum != '0' and m.tran_type = 'b';")
+        self.execute_cursor1(local_query)
+        updated = self.db_cursor1.rowcount
         self.db.commit()
         self.logger.log(f"Updated {updated} checks in checks DATABASE")
 
@@ -192,33 +440,33 @@ class ProcessDownloads(object):
         self.logger.log("-----------------------------------------------------------------")
         self.logger.log(f"{'Total:':53s} ${amount:>10.2f}")
 
-    def print_unrecorded_checks(self):
-        """Print a list of unrecorded checks"""
-        self.logger.log('\nCleared, unrecorded checks: ')
-        self.logger.log(f"{'CNum':5s} {'Cleared date':12s} {'Amount':>8s}")
+    def print_unrecorded_checks(self, since_date=None):
+        """Print a list of unrecorded checks
 
-        my_query = ("select tran_checknum,tran_date,tran_amount from main where tran_checknum != '0' "
-                    "and tran_type = 'b';")
-        self.execute_cursor1(my_query)
+        :param datetime.date since_date: only list checks that cleared on or after this date (default = all checks)
+        """
+        since = f" since {format_date(since_date)}" if since_date else ''
+        self.logger.log(f"\nCleared, unrecorded checks{since}: ")
+        self.logger.log(f"{'CNum':5s} {'Cleared date':12s} {'Amount':>8s}")
 
-        # for every cleared CU check, see if it also exists as a transaction in the checks DATABASE,
-        # with at least an amount
-        for inner_row in self.db_cursor1:
-            my_query = f"select tchecknum from checks where tchecknum = '{inner_row[0]}' and tamt is not null;"
-            self.execute_cursor2(my_query)
+        try:
+            unrecorded_checks = budgetQueries.query_cleared_unrecorded_checks(self.db_cursor1, since_date)
+        except pymysql.Error as sqlexc:
+            self.logger.log(f"print_unrecorded_checks(): Exception querying cleared, unrecorded checks: {sqlexc}")
+            sys.exit(1)
 
-            if self.db_cursor2.rowcount == 0:
-                self.logger.log(f"{inner_row[0]:5d} {inner_row[1].strftime('%m/%d/%Y'):12s} ${abs(inner_row[2]):>7.2f}")
+        for inner_row in unrecorded_checks:
+            self.logger.log(f"{inner_row[0]:5d} {inner_row[1].strftime('%m/%d/%Y'):12s} ${abs(inner_row[2]):>7.2f}")
 
     def print_uncleared_checks(self):
         """Print a list of uncleared checks"""
         my_dict = dict()
-        self.logger.log("\nUncleared checks since 1/1/2006: ")
+        self.logger.log(f"\nUncleared checks since {format_date(self.CHECKS_REPORT_START_DATE)}: ")
         self.logger.log(f"{'CNum':5s} {'Date':10s} {'Amt':>8s} {'Payee':30s} {'Comments'}")
 
         my_query = ("select tnum,tdate,tamt,tpayee,comments from checks where clear_date is null and "
-                    "tdate > '2005-12-31' and tamt != 0.0 order by tnum;")
-        self.execute_cursor1(my_query)
+                    "tdate >= %s and tamt != 0.0 order by tnum;")
+        self.execute_cursor1(my_query, (self.CHECKS_REPORT_START_DATE,))
 
         for inner_row in self.db_cursor1:
             key = f"{str(inner_row[1])}{inner_row[0]}{str(abs(inner_row[2]))}{inner_row[3]}{inner_row[4]}"
@@ -226,8 +474,8 @@ class ProcessDownloads(object):
                             f"{inner_row[3]:30s} {inner_row[4]}")
 
         my_query = ("select tnum,tdate,tamt,tpayee,comments from chasechecks where clear_date is null "
-                    "and tdate > '2005-12-31' and tamt != 0.0  order by tnum;")
-        self.execute_cursor1(my_query)
+                    "and tdate >= %s and tamt != 0.0  order by tnum;")
+        self.execute_cursor1(my_query, (self.CHECKS_REPORT_START_DATE,))
 
         for inner_row in self.db_cursor1:
             key = f"{str(inner_row[1])}{inner_row[0]}{str(abs(inner_row[2]))}{inner_row[3]}{inner_row[4]}"
@@ -253,65 +501,117 @@ class ProcessDownloads(object):
             # downloaded record is new and does not exist in the checks DATABASE
             # key, checknum, amt, date, payee, bud[0], bud[1], bud[2], comment
             #         0       1    2      3     4cat     5amt   6date     7
-            my_query = ("insert into checks (tnum,tchecknum,tamt,tdate,tpayee,bud_cat,bud_amt,bud_date,comments) "
-                        f"values ('{val[0]}','{val[0]}','{val[1]}','STR_TO_DATE('{val[2]}','%m/%d/%Y'),"
-                        f"'{val[3]}','{val[4]}','{val[5]}',STR_TO_DATE('{val[6]}','%m/%d/%Y'),'{val[7]}');")
+            params = (val[0], val[0], val[1], parse_date(val[2]) if val[2] else None, val[3], val[4], val[5],
+                      parse_date(val[6]) if val[6] else None, val[7])
             # If inserting is enabled, insert into DATABASE
             if self.DO_INSERT:
-                self.execute_cursor1(my_query)
+                self.execute_cursor1(self.INSERT_CHECKS_QUERY, params)
 
             self.logger.log(f"Key {key} is not in 'checks' DATABASE -- {('' if self.DO_INSERT else 'would have ')}"
                             "inserted")
             self.records_inserted += 1
 
-    def _resolve_possible_duplicate_record(self, new_key, val):
-        """Resolve possible duplicate record according to the user's input.
-        
+    def _resolve_possible_duplicate_record(self, new_key, val, existing_rows, duplicate_index, new_records):
+        """Resolve possible duplicate record according to the duplicate policy, or the user's input if the policy
+        leaves it to the user. Records the policy sends for review are queued in self.review_rows.
+
         :param str new_key: the transaction ID of the new record
-        :param list[any] val: some fields of the existing record
+        :param Transaction val: the new record
+        :param list[tuple] existing_rows: the existing records the new record may duplicate
+        :param DuplicateIndex duplicate_index: the index to drop a replaced record from
+        :param dict new_records: the records of this download file queued for insert, by transaction ID
         :returns: whether or not to continue to insert the new record
         :rtype: bool
         """
-        self.INSERT = 'insert'
-        self.IGNORE = 'ignore'
-        self.REPLACE = 'replace'
-
-        num_duplicates = self.db_cursor1.rowcount
+        num_duplicates = len(existing_rows)
         existing_record_key = ''
-        for row in self.db_cursor1:
+        for row in existing_rows:
             existing_record_key = row[0]
-            self.logger.log(f'existing record "{row[0]}" "{row[1]}" "{row[2]}" "{row[3]}" "{row[4]}"')
-        self.logger.log(f'new record "{new_key}" "{val[0]}" "{val[2]}" "{val[3] if val[3] else "0"}" "{val[5]}"')
-
-        if num_duplicates == 1:
-            response = utils.get_valid_response("What to do with possible duplicate record?",
-                                                [self.INSERT, self.IGNORE, self.REPLACE])
+            self.logger.log(f'existing record "{row[0]}" "{row[1]}" "{row[2]}" "{row[3]}" "{format_cents(row[4])}"')
+        self.logger.log(f'new record "{new_key}" "{format_date(val.tran_date)}" "{val.tran_desc}" '
+                        f'"{val.tran_checknum or "0"}" "{val.tran_amount}"')
+
+        existing_ids = [row[0] for row in existing_rows]
+        decision = self.duplicate_policy.decide(new_key, val.tran_date, val.tran_type, val.amount_cents, existing_ids)
+        if decision.action == duplicatePolicy.ASK:
+            if num_duplicates == 1:
+                response = utils.get_valid_response("What to do with possible duplicate record?",
+                                                    [duplicatePolicy.INSERT, duplicatePolicy.IGNORE,
+                                                     duplicatePolicy.REPLACE])
+            else:
+                response = utils.get_valid_response("What to do with possible duplicate record?",
+                                                    [duplicatePolicy.INSERT, duplicatePolicy.IGNORE])
+            self.logger.log(f"response='{response}'")
+            response = response.lower()
         else:
-            response = utils.get_valid_response("What to do with possible duplicate record?",
-                                                [self.INSERT, self.IGNORE])
-        self.logger.log(f"response='{response}'")
+            response = decision.action
+            self.logger.log(f"duplicate policy '{decision.reason}': {response}")
+
+        # Hold the new record back for a later batch review
+        if response == duplicatePolicy.REVIEW:
+            self.held_back_ids.add(val.tran_id)
+            self.review_rows.append(ReviewQueue.queue_row(self._main_row(new_key, val), existing_ids,
+                                                          decision.reason))
+            self.logger.log(f"Queued record with key {new_key} for duplicate review")
+            return False
 
         # Ignore new record
-        if response.lower() == self.IGNORE:
+        if response == duplicatePolicy.IGNORE:
             return False
 
         # Replace existing record with new record (delete existing record here, insert in caller)
-        if response.lower() == self.REPLACE:
-            delete_query = f'DELETE FROM main where tran_id = "{existing_record_key}";'
-            self.execute_cursor2(delete_query)
-            self.logger.log(f"Deleted record with key {existing_record_key} as part of replacing it.")
+        if response == duplicatePolicy.REPLACE:
+            # A record from earlier in the same download file is not in the table yet, so drop it from the queue
+            if existing_record_key in new_records:
+                del new_records[existing_record_key]
+                self.logger.log(f"Dropped record with key {existing_record_key} queued from this download file "
+                                "as part of replacing it.")
+            else:
+                self.execute_cursor2('DELETE FROM main where tran_id = %s;', (existing_record_key,))
+                self.logger.log(f"Deleted record with key {existing_record_key} as part of replacing it.")
+            duplicate_index.remove(existing_record_key)
             return True  # next, insert the new record
 
         # Insert new record
-        if response.lower() == self.INSERT:
+        if response == duplicatePolicy.INSERT:
             return True  # just insert the new record
 
-    def insert_dict_into_main_db(self, download_dict, keys_set):
+    @staticmethod
+    def _main_row(new_key, val):
+        """Return the INSERT_MAIN_QUERY parameters of a downloaded record
+
+        :param str new_key: the transaction ID to insert the record with
+        :param Transaction val: the record
+        :rtype: tuple
+        """
+        return (val.tran_date, new_key, val.tran_desc[:120], val.tran_checknum or "0", val.tran_type,
+                val.tran_amount, val.bud_category, val.bud_amount, val.bud_date or val.tran_date, val.comment)
+
+    def insert_dict_into_main_db(self, download_dict, keys_set, window_days=0):
         """Insert records from downloadDict into the main table
 
         :param dict download_dict: The dictionary of records to (possibly) insert
         :param set keys_set: The existing transaction IDs in the database
+        :param int window_days: also treat records this many days apart as possible duplicates, if their
+            descriptions only differ in case and whitespace (default = 0: same date and description only)
         """
+        timer = self.timer
+        timer.start()
+        new_records = dict()  # by transaction ID, so a replaced record of this file can be dropped
+        duplicate_index = DuplicateIndex()
+        if download_dict:
+            tran_dates = [val.tran_date for val in download_dict.values()]
+            try:
+                window = datetime.timedelta(days=window_days)
+                duplicate_index.load(self.db_cursor1, min(tran_dates) - window, max(tran_dates) + window)
+                # Keys outside a windowed key set's prefetch window are looked up in one batch, not one by one
+                if isinstance(keys_set, WindowedKeySet):
+                    keys_set.confirm(key for download_key in download_dict for key in download_key.split('|'))
+            except pymysql.Error as sqlexc:
+                self.logger.log(f"insert_dict_into_main_db(): Exception loading possible duplicates: {sqlexc}")
+                sys.exit(1)
+        timer.lap('load_duplicate_index')
+
         for key, val in download_dict.items():
             if '|' in key:
                 old_key = key.split('|')[0]
@@ -322,6 +622,16 @@ class ProcessDownloads(object):
 
             # Check for same transaction IDs in database and don't insert them.
             if old_key in keys_set or old_key + '-0' in keys_set or new_key in keys_set or new_key + '-0' in keys_set:
+                timer.lap('duplicate_check')
+                continue
+
+            # Records already waiting in the duplicate review queue are resolved there. Records ignored there
+            # stay ignored, and their lines are journaled like any other skipped line.
+            review_status = self.review_statuses.get(new_key)
+            if review_status is not None:
+                if review_status == duplicatePolicy.PENDING:
+                    self.held_back_ids.add(val.tran_id)
+                timer.lap('duplicate_check')
                 continue
 
             #
@@ -333,56 +643,96 @@ class ProcessDownloads(object):
             # for the same transactions downloaded at different times. Without this check, they
             # will get inserted into the database as duplicate transactions with different transaction 
             # IDs and cause problems that are hard to clean up later.
-            # Check with the user if the record should be inserted anyway. If not, don't insert it.
-            check_query = ('SELECT tran_ID,tran_date,tran_desc,tran_checknum,tran_amount from main where '
-                           f'tran_date=STR_TO_DATE("{val[0]}","%m/%d/%Y") and '
-                           f'tran_desc="{val[2]}" and tran_amount="{val[5]}" and '
-                           f'tran_checknum="{val[3]}";')
-            self.execute_cursor1(check_query)
+            # The duplicate policy, or the user, decides if the record should be inserted anyway.
+            # The existing records of the download's date span are indexed up front with one query.
+            # The other budget lines of a split transaction (key-0, key-1, ...) are not duplicates of each other.
+            # Some banks re-key a transaction and shift its date by a day or change its spacing, so for them
+            # the records dated within the download source's duplicate window are checked too.
+            if window_days:
+                candidates = duplicate_index.lookup_near(val.tran_date, val.tran_desc, val.amount_cents,
+                                                         val.tran_checknum, window_days)
+            else:
+                candidates = duplicate_index.lookup(val.tran_date, val.tran_desc, val.amount_cents, val.tran_checknum)
+            existing_rows = [row for row in candidates if not row[0].startswith(val.tran_id + '-')]
+            timer.lap('duplicate_check')
 
             # If the new record possibly matches an existing record, decide what to do with it
-            if self.db_cursor1.rowcount > 0:
+            if existing_rows:
                 self.logger.log("Possible duplicate record with different transaction ID")
-                if not self._resolve_possible_duplicate_record(new_key, val):
+                resolved = self._resolve_possible_duplicate_record(new_key, val, existing_rows, duplicate_index,
+                                                                   new_records)
+                timer.lap('duplicate_resolve')
+                if not resolved:
                     continue  # skip inserting the new record
 
-            # Insert the record into the database
-            if self.DO_INSERT:
-                my_query = ('INSERT into main (tran_date,tran_ID,tran_desc,tran_checknum,tran_type,tran_amount,'
-                            f'bud_category,bud_amount,bud_date,comment) VALUES (STR_TO_DATE("{val[0]}","%m/%d/%Y"), '
-                            f'"{new_key}", "{val[2][:120]}", "{(val[3] if val[3] else "0")}", "{val[4]}", "{val[5]}", '
-                            f'"{val[6]}", "{str(val[7])}", '
-                            f'STR_TO_DATE("{(val[8] if len(val[8]) else val[0])}","%m/%d/%Y"), "{val[9]}");')
-                self.execute_cursor1(my_query)
+            # Later records in the same download file may duplicate this one
+            duplicate_index.add(new_key, val.tran_date, val.tran_desc[:120], val.tran_checknum, val.amount_cents)
 
-                self.records_inserted += 1  # only increment the records_inserted counter here
-            else:  # Log like we are doing an insert, but don't insert and don't count it
-                val[1] = new_key
+            # Queue the record for the bulk insert into the database
+            new_records[new_key] = self._main_row(new_key, val)
+            if not self.DO_INSERT:  # Log like we are doing an insert, but don't insert and don't count it
+                val = val._replace(tran_id=new_key)
 
             self.logger.log(f"Key {new_key} is not in 'main' DATABASE -- "
-                            f"{('' if self.DO_INSERT else 'would have ')}inserted {val}")
+                            f"{('' if self.DO_INSERT else 'would have ')}inserted {val.as_list()}")
+            timer.lap('queue_insert')
+
+        # Write all the new records of the download file, any replaced-record deletes, and the records queued for
+        # duplicate review in one transaction
+        if self.DO_INSERT:
+            self.execute_many_in_transaction(self.INSERT_MAIN_QUERY, list(new_records.values()),
+                                             (ReviewQueue.ENQUEUE_QUERY, self.review_rows))
+            self.records_inserted += len(new_records)  # only increment the records_inserted counter here
+            self.records_queued += len(self.review_rows)
+            timer.lap('db_insert')
+        self.review_rows = []
 #
 # MAIN PROGRAM
 #
 
 
-do_insert = False
-do_validate = False
+# Worker processes of the parallel mode may import this module, so only run when executed as a script
+if __name__ == '__main__':
+    do_insert = False
+    do_validate = False
+    do_parallel = False
+    do_windowed_keys = False
+    do_stats = False
+    do_debug = False
+    unattended = False
 
-if len(sys.argv) > 1:
-    for arg in sys.argv:
-        if arg == sys.argv[0]:
-            continue
-        if arg == "insert":
-            do_insert = True
-        elif arg == "validate":
-            do_validate = True
-        else:
-            print(f"Usage {sys.argv[0]} [insert] [validate]")
-            print("\t'insert' = insert records into mysql database; otherwise just process and no insert. "
-                  "Default is False.")
-            print("\t'validate' = compare the records of the new way and old way of processing. Default is False.")
-            sys.exit(1)
-
-process_downloads = ProcessDownloads(do_insert=do_insert, do_validate=do_validate)
-process_downloads.execute()
+    if len(sys.argv) > 1:
+        for arg in sys.argv:
+            if arg == sys.argv[0]:
+                continue
+            if arg == "insert":
+                do_insert = True
+            elif arg == "validate":
+                do_validate = True
+            elif arg == "parallel":
+                do_parallel = True
+            elif arg == "windowed":
+                do_windowed_keys = True
+            elif arg == "stats":
+                do_stats = True
+            elif arg == "debug":
+                do_debug = True
+            elif arg == "unattended":
+                unattended = True
+            else:
+                print(f"Usage {sys.argv[0]} [insert] [validate] [parallel] [windowed] [stats] [debug] [unattended]")
+                print("\t'insert' = insert records into mysql database; otherwise just process and no insert. "
+                      "Default is False.")
+                print("\t'validate' = compare the records of the new way and old way of processing. Default is False.")
+                print("\t'parallel' = convert the download files in parallel worker processes. Default is False.")
+                print("\t'windowed' = only prefetch DB keys dated near the download files' dates. Default is False.")
+                print(f"\t'stats' = write per-stage timings to {ProcessDownloads.STATS_FILE}. Default is False.")
+                print("\t'debug' = also log per-transaction trace messages. Default is False.")
+                print("\t'unattended' = never ask about possible duplicates; queue the ones the duplicate policy "
+                      "leaves to the user for review. Default is False.")
+                sys.exit(1)
+
+    process_downloads = ProcessDownloads(do_insert=do_insert, do_validate=do_validate, do_parallel=do_parallel,
+                                         do_windowed_keys=do_windowed_keys, do_stats=do_stats, do_debug=do_debug,
+                                         unattended=unattended)
+    process_downloads.execute()
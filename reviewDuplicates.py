@@ -0,0 +1,49 @@
+#!/usr/local/bin/python3
+"""List and resolve the possible duplicate records processDownloads queued for review"""
+
+import sys
+import pymysql
+import globals
+from duplicatePolicy import ReviewQueue, INSERT, IGNORE, REPLACE
+
+
+def print_pending(pending):
+    """Print the pending review records
+
+    :param list[tuple] pending: rows from ReviewQueue.pending()
+    """
+    print(f"{'Id':>6s} {'Tran date':10s} {'Amount':>10s} {'Description':40s} {'Transaction ID':34s} Existing IDs")
+    for review_id, tran_id, tran_date, tran_desc, tran_amount, existing_ids, reason in pending:
+        print(f"{review_id:6d} {tran_date.strftime('%m/%d/%Y'):10s} {tran_amount:>10.2f} {tran_desc[:40]:40s} "
+              f"{tran_id:34s} {existing_ids} ({reason})")
+    print(f"{len(pending)} records waiting for review")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] not in (INSERT, IGNORE, REPLACE):
+        print(f"Usage {sys.argv[0]} [insert|ignore|replace [review_id ...]]")
+        print("\tWith no arguments, list the records waiting for duplicate review.")
+        print("\t'insert' = insert the records into the main table anyway.")
+        print("\t'ignore' = drop the records.")
+        print("\t'replace' = delete the existing record and insert the new one (records with one existing record "
+              "only).")
+        print("\tResolves all the waiting records unless review ids are given.")
+        sys.exit(1)
+
+    db = pymysql.connect(host='localhost', user='root', passwd=globals.DB_PASSWORD, db=globals.DB_NAME)
+    review_queue = ReviewQueue(db.cursor())
+    try:
+        review_queue.ensure_table()
+        if len(sys.argv) == 1:
+            print_pending(review_queue.pending())
+        else:
+            review_ids = [int(review_id) for review_id in sys.argv[2:]] or None
+            resolved = review_queue.resolve(sys.argv[1], review_ids)
+            db.commit()
+            print(f"Resolved {resolved} records with '{sys.argv[1]}'")
+    except pymysql.Error as sqlexc:
+        db.rollback()
+        print(f"Exception resolving the duplicate review queue: {sqlexc}")
+        sys.exit(1)
+    finally:
+        db.close()
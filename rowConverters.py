@@ -0,0 +1,133 @@
+"""Per-source row conversion functions compiled from the download field maps"""
+
+import hashlib
+from collections import namedtuple
+from money import parse_cents, format_cents
+
+# The compiled conversion steps of one download source. Every decision that depends only on the field map is
+# made when the steps are compiled, so each step does only the per-row work.
+#   is_pending(fields) -> bool, or None if the source has no status filter
+#   amount(fields) -> the transaction amount in cents, negated if the source needs it
+#   transaction_id(fields, transaction_date, transaction_cents, transaction_payee) -> the transaction ID
+RowConverter = namedtuple('RowConverter', ['is_pending', 'amount', 'transaction_id'])
+
+
+def _compile_is_pending(field_map):
+    """Return the pending-status test of the source, or None if it has none
+
+    :param Mapping field_map: the source's field map
+    :rtype: function|None
+    """
+    index_status = field_map.get('status')
+    # A status field at index 0 has never filtered anything (the Citi download). Keep it that way so the
+    # output stays the same.
+    if not index_status:
+        return None
+
+    def is_pending(fields):
+        return fields[index_status].lower() == 'pending'
+    return is_pending
+
+
+def _compile_amount(field_map):
+    """Return the amount function of the source, which gives the amount in cents
+
+    :param Mapping field_map: the source's field map
+    :rtype: function
+    """
+    negate = field_map['negate']
+    if 'credit' in field_map and 'debit' in field_map:
+        index_credit = field_map['credit']
+        index_debit = field_map['debit']
+        # Some download files split the transaction amount into a "credit" field or a "debit" field
+        if negate:
+            def amount(fields):
+                return -parse_cents(fields[index_credit] if fields[index_credit] else fields[index_debit])
+        else:
+            def amount(fields):
+                return parse_cents(fields[index_credit] if fields[index_credit] else fields[index_debit])
+    else:
+        index_amount = field_map['amount']
+        if negate:
+            def amount(fields):
+                return -parse_cents(fields[index_amount])
+        else:
+            def amount(fields):
+                return parse_cents(fields[index_amount])
+    return amount
+
+
+def _compile_tid_part(fld, field_map):
+    """Return the function that gives one part of a built transaction ID
+
+    :param str fld: the name of the field in tid_fields
+    :param Mapping field_map: the source's field map
+    :rtype: function
+    """
+    tid_date_format = field_map.get('tid_date_format')
+    if fld == "date" and tid_date_format is None:
+        return lambda fields, transaction_date, transaction_cents, transaction_payee: transaction_date
+    if fld == "amount":
+        # The IDs were first built from the amount formatted as a float, which gave a negated 0 as '-0.00'
+        zero_text = '-0.00' if field_map['negate'] else '0.00'
+
+        def amount_part(fields, transaction_date, transaction_cents, transaction_payee):
+            return format_cents(transaction_cents) if transaction_cents else zero_text
+        return amount_part
+    if fld == "payee":
+        return lambda fields, transaction_date, transaction_cents, transaction_payee: transaction_payee
+
+    # use whatever field specified - unique to each field map
+    index = field_map[fld]
+    # Some downloads have more than one date, such as Discover card which has "Trans. Date", and "Post Date"
+    # and use all the dates in their transaction ID. The original date format is assumed to be "mm/dd/yyyy".
+    if fld.startswith('date') and tid_date_format == 'yyyymmdd':
+        def date_part(fields, transaction_date, transaction_cents, transaction_payee):
+            date_arr = fields[index].split('/')
+            return f"{date_arr[2]}{date_arr[0]}{date_arr[1]}"
+        return date_part
+    if fld.startswith('date') and tid_date_format == 'mmddyyyy':
+        def date_part(fields, transaction_date, transaction_cents, transaction_payee):
+            date_arr = fields[index].split('/')
+            return f"{date_arr[0]}{date_arr[1]}{date_arr[2]}"
+        return date_part
+    return lambda fields, transaction_date, transaction_cents, transaction_payee: fields[index]
+
+
+def _compile_transaction_id(field_map):
+    """Return the transaction ID function of the source.
+
+    Some financial institutions include a unique ID field for each transaction in their download. If there
+    is one, it is used. Otherwise the ID combines the tid_fields of the field map, optionally as an md5
+    checksum. All spaces are removed.
+
+    :param Mapping field_map: the source's field map
+    :rtype: function
+    """
+    if 'tid' in field_map:
+        index_tid = field_map['tid']
+
+        def transaction_id(fields, transaction_date, transaction_cents, transaction_payee):
+            return fields[index_tid].replace(' ', '')
+        return transaction_id
+
+    parts = [_compile_tid_part(fld, field_map) for fld in field_map['tid_fields']]
+    if field_map['md5']:
+        def transaction_id(fields, transaction_date, transaction_cents, transaction_payee):
+            tid = ''.join([part(fields, transaction_date, transaction_cents, transaction_payee) for part in parts])
+            return hashlib.md5(tid.encode('utf-8')).hexdigest()
+    else:
+        def transaction_id(fields, transaction_date, transaction_cents, transaction_payee):
+            tid = ''.join([part(fields, transaction_date, transaction_cents, transaction_payee) for part in parts])
+            return tid.replace(' ', '')
+    return transaction_id
+
+
+def compile_row_converter(field_map):
+    """Compile a download source's field map into its row conversion functions
+
+    :param Mapping field_map: the source's field map, already validated
+    :rtype: RowConverter
+    """
+    return RowConverter(_compile_is_pending(field_map), _compile_amount(field_map),
+                        _compile_transaction_id(field_map))
@@ -0,0 +1,89 @@
+"""Compiled snapshot of the payee category rules, cached on disk between runs"""
+
+import os
+import re
+import json
+from collections import namedtuple
+from transferPayee import TransferPayee
+from payeeMatcher import PayeeMatcher
+from substringMatcher import SubstringMatcher
+from categoryCache import files_fingerprint
+from utils import atomic_write
+
+# Bump when the layout of the compiled rule objects changes, so old snapshot files are rebuilt
+SNAPSHOT_VERSION = 2
+
+# payee_dict and payroll_ignore_transfer_dict are the parsed source files. payee_matcher and
+# payroll_ignore_transfer_matcher are the compiled lookup structures built from them.
+RuleSet = namedtuple('RuleSet', ['payee_dict', 'payee_matcher', 'payroll_ignore_transfer_dict',
+                                 'payroll_ignore_transfer_matcher'])
+
+
+def compile_rules(payee_file, payroll_ignore_transfer_file):
+    """Parse the rule source files and build the lookup structures
+
+    :param str payee_file: the payee file name
+    :param str payroll_ignore_transfer_file: the payroll/ignore/transfer json file name
+    :rtype: RuleSet
+    """
+    payee_dict = TransferPayee().read_payee_file(payee_file)
+    with open(payroll_ignore_transfer_file) as data_file:
+        payroll_ignore_transfer_dict = json.load(data_file)
+    return RuleSet(payee_dict, PayeeMatcher(payee_dict), payroll_ignore_transfer_dict,
+                   SubstringMatcher(payroll_ignore_transfer_dict.keys()))
+
+
+def _snapshot_data(rules):
+    """Return the rules as json-compatible snapshot data
+
+    :param RuleSet rules: the compiled rules
+    :rtype: dict
+    """
+    return {'payee_dict': sorted(rules.payee_dict.items()),  # json object keys would turn the line numbers to str
+            'payee_matcher': rules.payee_matcher.to_state(),
+            'payroll_ignore_transfer_dict': rules.payroll_ignore_transfer_dict,
+            'payroll_ignore_transfer_matcher': rules.payroll_ignore_transfer_matcher.to_state()}
+
+
+def _rules_of_snapshot(data):
+    """Return the rules of the snapshot data
+
+    :param dict data: the snapshot data from _snapshot_data()
+    :rtype: RuleSet
+    """
+    return RuleSet({line_num: rule for line_num, rule in data['payee_dict']},
+                   PayeeMatcher.from_state(data['payee_matcher']),
+                   data['payroll_ignore_transfer_dict'],
+                   SubstringMatcher.from_state(data['payroll_ignore_transfer_matcher']))
+
+
+def load_rules(payee_file, payroll_ignore_transfer_file, snapshot_file):
+    """Return the compiled rules, from the snapshot file if it was built from the current source files.
+    Otherwise compile the rules and save a new snapshot.
+
+    The snapshot is json. Its first line is the snapshot version and the hash of the source files, and the rest
+    is only read if that line matches. It holds the parsed payee timelines, the source of the combined payee
+    regex and the substring matcher tables, so loading it compiles one regex and parses nothing else.
+
+    :param str payee_file: the payee file name
+    :param str payroll_ignore_transfer_file: the payroll/ignore/transfer json file name
+    :param str snapshot_file: the snapshot file name
+    :rtype: RuleSet
+    """
+    fingerprint = f"{SNAPSHOT_VERSION}:{files_fingerprint([payee_file, payroll_ignore_transfer_file])}"
+    if os.path.exists(snapshot_file):
+        try:
+            with open(snapshot_file, 'r') as f_ptr:
+                if f_ptr.readline().rstrip('\n') == fingerprint:
+                    return _rules_of_snapshot(json.load(f_ptr))
+        except (OSError, ValueError, KeyError, TypeError, re.error):
+            pass  # unreadable snapshot is the same as no snapshot
+
+    rules = compile_rules(payee_file, payroll_ignore_transfer_file)
+    try:
+        with atomic_write(snapshot_file) as f_ptr:
+            f_ptr.write(fingerprint + '\n')
+            json.dump(_snapshot_data(rules), f_ptr)
+    except OSError:
+        pass  # the snapshot only speeds up the next run
+    return rules
@@ -0,0 +1,98 @@
+"""Wall time and call count instrumentation for the stages of the download pipeline"""
+
+import json
+import time
+
+
+class StageTimer(object):
+    """Lap timer that adds up the wall time and number of calls of named stages.
+
+    Call start() when a unit of work begins and lap(stage) as each stage of it ends. The time since the
+    previous lap (or start) is charged to the stage, so a stage costs one clock read and one dict update.
+    """
+    enabled = True
+
+    def __init__(self):
+        self.stages = dict()
+        self.counts = dict()
+        self._last = time.perf_counter()
+
+    def start(self):
+        """Start timing from now, without charging the time since the last lap to any stage"""
+        self._last = time.perf_counter()
+
+    def lap(self, stage):
+        """Charge the time since the previous lap to the stage and count one call of it
+
+        :param str stage: the stage name
+        """
+        now = time.perf_counter()
+        entry = self.stages.get(stage)
+        if entry is None:
+            self.stages[stage] = [1, now - self._last]
+        else:
+            entry[0] += 1
+            entry[1] += now - self._last
+        self._last = now
+
+    def count(self, name, amount=1):
+        """Add to a named event counter
+
+        :param str name: the counter name
+        :param int amount: the amount to add (default = 1)
+        """
+        self.counts[name] = self.counts.get(name, 0) + amount
+
+    def merge(self, stages, counts):
+        """Add the stage times and counters recorded by another timer, e.g. one in a worker process
+
+        :param dict stages: the other timer's stages
+        :param dict counts: the other timer's counters
+        """
+        for stage, (calls, seconds) in stages.items():
+            entry = self.stages.setdefault(stage, [0, 0.0])
+            entry[0] += calls
+            entry[1] += seconds
+        for name, amount in counts.items():
+            self.count(name, amount)
+
+    def summary(self):
+        """Return the stage times and counters, slowest stage first
+
+        :rtype: dict
+        """
+        stages = sorted(self.stages.items(), key=lambda item: item[1][1], reverse=True)
+        return {'stages': {stage: {'calls': calls, 'seconds': round(seconds, 6)}
+                           for stage, (calls, seconds) in stages},
+                'counts': dict(self.counts)}
+
+    def save(self, file_name, **extra):
+        """Write the summary, and any extra top-level values, to a JSON file
+
+        :param str file_name: the name of the file
+        """
+        data = dict(extra)
+        data.update(self.summary())
+        with open(file_name, 'w') as f_ptr:
+            json.dump(data, f_ptr, indent=2)
+
+
+class NullStageTimer(StageTimer):
+    """A StageTimer that records nothing, for when instrumentation is turned off"""
+    enabled = False
+
+    def start(self):
+        pass
+
+    def lap(self, stage):
+        pass
+
+    def count(self, name, amount=1):
+        pass
+
+    def merge(self, stages, counts):
+        pass
+
+
+# Shared do-nothing timer, used when the caller doesn't pass one
+NULL_TIMER = NullStageTimer()
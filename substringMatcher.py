@@ -0,0 +1,104 @@
+"""Multi-pattern substring matcher (Aho-Corasick automaton)"""
+
+from collections import deque
+
+
+class SubstringMatcher(object):
+    """Find which of a list of literal substrings occur in a string, in one pass over the string.
+
+    The keys are compiled into an Aho-Corasick automaton. Each key keeps its position in the list as its
+    priority, so first_match() returns the same key as testing 'key in text' for each key in order.
+
+    :param list[str] keys: the substrings to look for, highest priority first
+    """
+    def __init__(self, keys):
+        self._keys = list(keys)
+
+        # goto[state] maps a character to the next state, fail[state] is the fallback state, and
+        # best[state] is the highest priority (lowest index) of any key ending at state, or None
+        self._goto = [{}]
+        self._fail = [0]
+        self._best = [None]
+        for priority, key in enumerate(self._keys):
+            if not key:
+                continue  # an empty key would match everything; 'key in text' treats it the same
+            state = 0
+            for char in key:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._best.append(None)
+                state = next_state
+            if self._best[state] is None:
+                self._best[state] = priority
+        self._empty_key = min((i for i, key in enumerate(self._keys) if not key), default=None)
+
+        # breadth-first pass to set the failure links and merge the outputs of each state's suffixes
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                fail_state = self._goto[fallback].get(char, 0)
+                self._fail[next_state] = fail_state if fail_state != next_state else 0
+                inherited = self._best[self._fail[next_state]]
+                if inherited is not None and (self._best[next_state] is None or
+                                              inherited < self._best[next_state]):
+                    self._best[next_state] = inherited
+
+    @property
+    def keys(self):
+        return self._keys
+
+    def to_state(self):
+        """Return the automaton as json-compatible data for from_state()
+
+        :rtype: dict
+        """
+        return {'keys': self._keys, 'goto': self._goto, 'fail': self._fail, 'best': self._best,
+                'empty_key': self._empty_key}
+
+    @classmethod
+    def from_state(cls, state):
+        """Return the matcher of the data from to_state(), without building the automaton again
+
+        :param dict state: the automaton data
+        :rtype: SubstringMatcher
+        """
+        matcher = cls.__new__(cls)
+        matcher._keys = state['keys']
+        matcher._goto = state['goto']
+        matcher._fail = state['fail']
+        matcher._best = state['best']
+        matcher._empty_key = state['empty_key']
+        return matcher
+
+    def first_match(self, text):
+        """Return the highest priority key that occurs in text, or None if none of them do.
+
+        :param str text: the string to search
+        :rtype: str|None
+        """
+        best = self._empty_key
+        if best == 0:
+            return self._keys[0]
+        goto = self._goto
+        fail = self._fail
+        best_at = self._best
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            found = best_at[state]
+            if found is not None and (best is None or found < best):
+                best = found
+                if best == 0:
+                    break
+        return None if best is None else self._keys[best]
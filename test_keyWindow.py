@@ -0,0 +1,60 @@
+import datetime
+import unittest
+from keyWindow import WindowedKeySet
+
+
+class FakeCursor(object):
+    """Answers the WindowedKeySet queries from a list of (tran_ID, tran_date) main table rows"""
+    def __init__(self, main_rows):
+        self.main_rows = main_rows
+        self.queries = []
+        self._rows = []
+
+    def execute(self, query, params):
+        self.queries.append(query)
+        if 'tran_date between' in query:
+            self._rows = [(tran_id,) for tran_id, tran_date in self.main_rows if params[0] <= tran_date <= params[1]]
+        else:
+            self._rows = [(tran_id,) for tran_id, _ in self.main_rows if tran_id in params]
+
+    def __iter__(self):
+        return iter(self._rows)
+
+
+class TestWindowedKeySet(unittest.TestCase):
+
+    def setUp(self):
+        self.cursor = FakeCursor([('NEW', datetime.date(2022, 6, 1)), ('OLD-0', datetime.date(2019, 1, 1)),
+                                  ('OLDER', datetime.date(2018, 1, 1))])
+        self.keys = WindowedKeySet(self.cursor, datetime.date(2022, 5, 1), datetime.date(2022, 7, 1))
+
+    def test_window(self):
+        self.assertEqual(len(self.keys), 1)
+        self.assertIn('NEW', self.keys)
+        self.assertEqual(len(self.cursor.queries), 1)
+
+    def test_confirm_in_one_query(self):
+        download_keys = ['NEW', 'OLD', 'OLDER', 'MISSING1', 'MISSING2-0']
+        self.keys.confirm(download_keys)
+        self.assertEqual(len(self.cursor.queries), 2)
+        found = [key for key in download_keys for key in (key, key + '-0') if key in self.keys]
+        self.assertEqual(found, ['NEW', 'OLD-0', 'OLDER'])
+        self.assertNotIn('MISSING2', self.keys)
+        self.assertEqual(len(self.cursor.queries), 2)
+        self.assertEqual(self.keys.db_queries, 1)
+
+    def test_unconfirmed_key(self):
+        self.assertIn('OLD-0', self.keys)
+        self.assertNotIn('OTHER', self.keys)
+        self.assertEqual(self.keys.db_queries, 2)
+        self.assertNotIn('OLD', self.keys.local_keys())
+
+    def test_batches(self):
+        self.keys.CONFIRM_BATCH_SIZE = 3
+        self.keys.confirm(['A', 'B', 'C'])
+        self.assertEqual(self.keys.db_queries, 2)
+        self.assertEqual(self.keys.db_confirmations, 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
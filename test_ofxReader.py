@@ -0,0 +1,70 @@
+import io
+import unittest
+from ofxReader import OfxFormatError, OfxTransaction, iter_ofx_transactions
+
+SGML_FILE = """OFXHEADER:100
+DATA:OFXSGML
+VERSION:102
+
+<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>
+<STMTTRN><TRNTYPE>CREDIT<DTPOSTED>20150203050000.000<TRNAMT>566.64<FITID>7514021503<NAME>PAYMENT</STMTTRN>
+<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20150204<TRNAMT>-1,234.50<FITID>7514021504<NAME>RENT &amp; FEES
+<MEMO>FEBRUARY</STMTTRN>
+</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>
+"""
+
+XML_FILE = """<?xml version="1.0" encoding="UTF-8"?>
+<?OFX OFXHEADER="200" VERSION="220"?>
+<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>
+<STMTTRN><TRNTYPE>CHECK</TRNTYPE><DTPOSTED>20150205</DTPOSTED><TRNAMT>-1.234,56</TRNAMT>
+<FITID>7514021505</FITID><CHECKNUM>1021</CHECKNUM><NAME>CHECK 1021</NAME></STMTTRN>
+<STMTTRN><TRNTYPE>DEBIT</TRNTYPE><DTPOSTED>20150206</DTPOSTED><TRNAMT>-12,5</TRNAMT>
+<FITID>7514021506</FITID><NAME>COFFEE</NAME></STMTTRN>
+</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>
+"""
+
+CHUNK_SIZES = (1, 3, 7, 64 * 1024)
+
+
+def make_file(trnamt):
+    return f"<OFX><STMTTRN><DTPOSTED>20150203<TRNAMT>{trnamt}<FITID>1<NAME>PAYEE</STMTTRN></OFX>"
+
+
+def read_amount(trnamt):
+    transactions = list(iter_ofx_transactions(io.StringIO(make_file(trnamt))))
+    return transactions[0].amount_cents
+
+
+class TestOfxReader(unittest.TestCase):
+
+    def test_sgml(self):
+        for chunk_size in CHUNK_SIZES:
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(list(iter_ofx_transactions(io.StringIO(SGML_FILE), chunk_size)), [
+                    OfxTransaction('7514021503', '02/03/2015', 56664, 'PAYMENT', '', 'CREDIT', ''),
+                    OfxTransaction('7514021504', '02/04/2015', -123450, 'RENT & FEES', 'FEBRUARY', 'DEBIT', '')])
+
+    def test_xml(self):
+        for chunk_size in CHUNK_SIZES:
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(list(iter_ofx_transactions(io.StringIO(XML_FILE), chunk_size)), [
+                    OfxTransaction('7514021505', '02/05/2015', -123456, 'CHECK 1021', '', 'CHECK', '1021'),
+                    OfxTransaction('7514021506', '02/06/2015', -1250, 'COFFEE', '', 'DEBIT', '')])
+
+    def test_separators(self):
+        for trnamt, expected in (('-1,234.50', -123450), ('1,234,567.89', 123456789), ('-1.234,50', -123450),
+                                 ('1.234.567,89', 123456789), ('1 234,50', 123450), ('1 234.50', 123450),
+                                 ("1'234.50", 123450), ('12,50', 1250), ('1,234', 123400), ('1.234.567', 123456700),
+                                 ('+3', 300), ('.5', 50), ('1.234', 123), ('1,2', 120)):
+            with self.subTest(trnamt=trnamt):
+                self.assertEqual(read_amount(trnamt), expected)
+
+    def test_bad_amount(self):
+        for trnamt in ('12.34.56,7', '1,23,45', 'ABC', '-'):
+            with self.subTest(trnamt=trnamt):
+                with self.assertRaises(OfxFormatError):
+                    read_amount(trnamt)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import os
+import datetime
+import tempfile
+import unittest
+from unittest import mock
+from processDownloads import ProcessDownloads
+from transaction import Transaction
+
+
+class FakeDatabase(object):
+    """The main and duplicate_review tables, with a cursor that answers the queries ProcessDownloads and
+    ReviewQueue make of them
+    """
+    def __init__(self, main_rows):
+        self.main = list(main_rows)
+        self.review = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeCursor(object):
+    def __init__(self, database):
+        self._database = database
+        self._rows = []
+        self.rowcount = 0
+
+    def execute(self, query, params=None):
+        self._rows = []
+        if query.startswith('SELECT tran_ID,tran_date,tran_desc,tran_checknum,tran_amount from main'):
+            self._rows = [row for row in self._database.main if params[0] <= row[1] <= params[1]]
+        elif query.startswith('SELECT tran_ID,status from duplicate_review'):
+            self._rows = [(row[1], row[-1]) for row in self._database.review if row[-1] in ('pending', 'ignored')]
+        elif query.startswith('UPDATE duplicate_review'):
+            pending = [i for i, row in enumerate(self._database.review) if row[-1] == 'pending']
+            for i in pending:
+                self._database.review[i] = self._database.review[i][:-1] + (params[0],)
+            self.rowcount = len(pending)
+
+    def executemany(self, query, rows):
+        if query.startswith('INSERT into main'):
+            self._database.main.extend((row[1], row[0], row[2], row[3], row[5]) for row in rows)
+        elif query.startswith('INSERT into duplicate_review'):
+            self._database.review.extend(tuple(row) + ('pending',) for row in rows)
+
+    def __iter__(self):
+        return iter(self._rows)
+
+
+class TestDuplicateReview(unittest.TestCase):
+
+    def setUp(self):
+        cwd = os.getcwd()
+        temp_dir = tempfile.TemporaryDirectory()
+        os.chdir(temp_dir.name)
+        self.addCleanup(temp_dir.cleanup)
+        self.addCleanup(os.chdir, cwd)
+        self.database = FakeDatabase([('OLD1', datetime.date(2022, 1, 5), 'AMAZON', 0, '12.50')])
+        self.download = {'NEW1': Transaction.from_strings('01/05/2022', 'NEW1', 'AMAZON', '', 'C', '12.50',
+                                                          'UNKNOWN', '12.50', '', '')}
+
+    def run_downloads(self):
+        with mock.patch('pymysql.connect', return_value=self.database), mock.patch('processDownloads.Logger'):
+            process = ProcessDownloads(do_insert=True, unattended=True)
+        process._load_review_queue()
+        process.insert_dict_into_main_db(dict(self.download), set())
+        return process
+
+    def test_pending_record_is_held_back(self):
+        self.run_downloads()
+        process = self.run_downloads()
+        self.assertEqual(len(self.database.review), 1)
+        self.assertEqual(process.records_queued, 0)
+        self.assertEqual(process.held_back_ids, {'NEW1'})
+
+    def test_ignored_record_is_not_queued_again(self):
+        process = self.run_downloads()
+        self.assertEqual(process.records_queued, 1)
+        self.assertEqual(process.review_queue.resolve('ignore'), 1)
+
+        process = self.run_downloads()
+        self.assertEqual(len(self.database.review), 1)
+        self.assertEqual(process.records_queued, 0)
+        self.assertEqual(process.records_inserted, 0)
+        self.assertEqual(process.held_back_ids, set())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+"""Compact record of one budget line of a downloaded transaction"""
+
+from collections import namedtuple
+from money import parse_cents, format_cents
+from downloadDates import parse_date, format_date
+
+
+_TransactionFields = namedtuple('_TransactionFields', [
+    'tran_date', 'tran_id', 'tran_desc', 'tran_checknum', 'tran_type', 'amount_cents', 'bud_category',
+    'bud_cents', 'bud_date', 'comment'])
+
+
+class Transaction(_TransactionFields):
+    """One budget line of a downloaded transaction, as it goes into the main table.
+
+    The dates are datetime.date objects (bud_date is None if the line has no budget date of its own) and the
+    amounts are whole cents. tran_checknum is the check number string, or '' if the transaction is not a
+    check. Records are immutable tuples; use _replace() to change a field.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_strings(cls, tran_date, tran_id, tran_desc, tran_checknum, tran_type, tran_amount, bud_category,
+                     bud_amount, bud_date, comment):
+        """Return the record of the string field values the download readers produce
+
+        :param str tran_date: the 'mm/dd/yyyy' transaction date
+        :param str tran_id: the transaction ID
+        :param str tran_desc: the transaction description
+        :param str tran_checknum: the check number, or ''
+        :param str tran_type: the transaction type
+        :param str tran_amount: the transaction amount
+        :param str bud_category: the budget category
+        :param str|int bud_amount: the budget amount
+        :param str bud_date: the 'mm/dd/yyyy' budget date, or ''
+        :param str comment: the comment
+        :rtype: Transaction
+        """
+        return cls(parse_date(tran_date), tran_id, tran_desc, tran_checknum, tran_type, parse_cents(tran_amount),
+                   bud_category, parse_cents(bud_amount), parse_date(bud_date) if bud_date else None, comment)
+
+    @property
+    def tran_amount(self):
+        """The transaction amount as a '[-]d.dd' string
+
+        :rtype: str
+        """
+        return format_cents(self.amount_cents)
+
+    @property
+    def bud_amount(self):
+        """The budget amount as a '[-]d.dd' string
+
+        :rtype: str
+        """
+        return format_cents(self.bud_cents)
+
+    def as_list(self):
+        """Return the record in the list form the download readers used to produce, with 'mm/dd/yyyy' dates
+        and '[-]d.dd' amounts, e.g. to log it or compare it field by field
+
+        :rtype: list[str]
+        """
+        return [format_date(self.tran_date), self.tran_id, self.tran_desc, self.tran_checknum, self.tran_type,
+                self.tran_amount, self.bud_category, self.bud_amount, format_date(self.bud_date), self.comment]
@@ -1,4 +1,5 @@
 import collections
+import money
 
 
 def pretty(the_dict, indent=0):
@@ -9,7 +10,7 @@ def pretty(the_dict, indent=0):
     :param dict the_dict: the dictionary to print
     :param int indent: the indent to use for each level (default to 0)
     """
-    for key, value in the_dict.iteritems():
+    for key, value in the_dict.items():
         print('  ' * indent + str(key))
         if isinstance(value, dict):
             pretty(value, indent+1)
@@ -131,36 +132,21 @@ def read_checks_file(file_name):
             # Parse the budget category
             bud_dict = parse_budget_fields(field[3:])
 
-            # finish processing them
-            trans_amt_is_neg = amt.startswith('-')
-
-            # remainder is a double and is always POSITIVE
-            remainder = abs(float(amt))
+            # finish processing them: the amounts are worked out in cents and formatted for the checks table
             print(f"bud_dict={bud_dict}")
             print(f"bud_dict.items()={bud_dict.items()}")
             print(f"line {line_num} '{line}'")
-            # for key, val in collections.OrderedDict(bud_dict.items()):
-            for key, val in collections.OrderedDict(sorted(bud_dict.items())).iteritems():
-                if not val[0]:
+            ordered_keys = sorted(bud_dict)
+            line_cents = [money.parse_cents(bud_dict[key][1]) if bud_dict[key][1] else None for key in ordered_keys]
+            amounts, over_assigned = money.split_cents(money.parse_cents(amt), line_cents)
+            if over_assigned:  # something didn't add up
+                print(f"Calculating amounts for {[bud_dict[key] for key in ordered_keys]} and the budget amounts "
+                      "are more than the check amount.")
+            for key, cents in zip(ordered_keys, amounts):
+                if not bud_dict[key][0]:
                     bud_dict[key][0] = 'UNKNOWN'  # default
-
-                # The assumption is that all budget amounts are positive, but use the same sign as
-                # the transaction amount
-                if not val[1]:  # no budget amount?
-
-                    # assign any remainder to it
-                    bud_dict[key][1] = '%.2f' % (-1.0*remainder if trans_amt_is_neg else remainder)
-
-                    remainder = 0.0
-                else:  # otherwise decrement remainder by the budget amount
-                    # keep track of the remainder
-                    remainder = remainder - float(val[1])
-                    if trans_amt_is_neg and not bud_dict[key][1].startswith('-'):
-                        bud_dict[key][1] = '-'+bud_dict[key][1]
-                    if remainder < 0.0:  # something didn't add up
-                        remainder = 0.0
-                        print(f"Calculating amount for {val} and got a remainder less than zero.")
-                if not val[2]:  # no budget date?
+                bud_dict[key][1] = money.format_cents(cents)
+                if not bud_dict[key][2]:  # no budget date?
                     bud_dict[key][2] = date  # assign transaction date
 
             if len(bud_dict) == 1:
@@ -168,7 +154,7 @@ def read_checks_file(file_name):
                                        bud_dict[0][0], bud_dict[0][1], bud_dict[0][2], comment]
             else:
                 key_prefix = check_num
-                for key, bud in collections.OrderedDict(sorted(bud_dict.items())):
+                for key, bud in collections.OrderedDict(sorted(bud_dict.items())).items():
                     my_key = key_prefix + '-' + str(key)
                     out_dict[my_key] = [check_num, amt, date, payee, bud[0], bud[1], bud[2], comment]
                     transactions += 1
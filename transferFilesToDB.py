@@ -1,14 +1,13 @@
 """Module contains methods to etc"""
 
 from __future__ import print_function
-import re
-import datetime
 import glob
-import json
 from warnings import filterwarnings
 import pprint
 import pymysql
-from transferPayee import TransferPayee
+from downloadDates import day_ordinal
+from ruleSnapshot import load_rules
+from categoryCache import CategoryCache, budget_month
 
 filterwarnings('ignore', category=pymysql.Warning)
 
@@ -45,20 +44,31 @@ class TransferMonthlyFilesToDB(object):
     """Class to transfer monthly files to DATABASE
 
     :param Any cursor: the DATABASE CURSOR object
+    :param utils.Logger logger: the logger
+    :param bool dump_payees: pretty-print the payee rules to the console (default = False)
     """
 
     DEFAULT_BUDGET_CATEGORY = 'UNKNOWN'
+    PAYEE_FILE = 'payee'
+    PAYROLL_IGNORE_TRANSFER_FILE = 'payroll_ignore_transfer.json'
+    CATEGORY_CACHE_FILE = 'payee_category_cache.json'
+    RULE_SNAPSHOT_FILE = 'payee_rules.snapshot'
 
-    def __init__(self, cursor, logger):
+    def __init__(self, cursor, logger, dump_payees=False):
         self.cur = cursor
         self.logger = logger
-        # Initialize payee table
-        payee = TransferPayee()
-        self.payee_dict = payee.read_payee_file('payee')
-        with open('payroll_ignore_transfer.json') as data_file:
-            self.payroll_ignore_transfer_dict = json.load(data_file)
+        # Initialize payee table and the payroll/ignore/transfer table. They are only parsed and compiled when
+        # their files have changed since the last run; otherwise the compiled snapshot is loaded.
+        rules = load_rules(self.PAYEE_FILE, self.PAYROLL_IGNORE_TRANSFER_FILE, self.RULE_SNAPSHOT_FILE)
+        self.payee_dict = rules.payee_dict
+        self.payee_matcher = rules.payee_matcher
+        self.payroll_ignore_transfer_dict = rules.payroll_ignore_transfer_dict
+        self.payroll_ignore_transfer_matcher = rules.payroll_ignore_transfer_matcher
+        self.category_cache = CategoryCache(self.CATEGORY_CACHE_FILE,
+                                            [self.PAYEE_FILE, self.PAYROLL_IGNORE_TRANSFER_FILE])
         self.pretty_print = pprint.PrettyPrinter(indent=4)
-        self.pretty_print.pprint(self.payee_dict)
+        if dump_payees:
+            self.pretty_print.pprint(self.payee_dict)
         self.unexpected_header = []
         self.total_files = 0
         self.files_processed = 0
@@ -89,14 +99,34 @@ class TransferMonthlyFilesToDB(object):
             else:
                 self.logger.log('  ' * (indent + 1) + str(value))
 
+    def save_category_cache(self):
+        """Save the payee category cache to disk and log its hit/miss counters"""
+        self.category_cache.save()
+        self.logger.log(self.category_cache.stats())
+
     def lookup_payee_category(self, payee, budget_date):
+        """Return a budget category based on the payee string passed in, and the budget date.
+        Results are cached by payee and budget month.
+
+        :param str payee: the payee string
+        :param str budget_date: the budget date string
+        :rtype: str
+        """
+        month = budget_month(budget_date)
+        category = self.category_cache.get(payee, month)
+        if category is None:
+            category = self._match_payee_category(payee, budget_date)
+            self.category_cache.put(payee, month, category)
+        return category
+
+    def _match_payee_category(self, payee, budget_date):
         """Return a budget category based on the payee string passed in, and the budget date
 
         Budget assignments based on the payee string change over time. That's why the budget date is
         needed to differentiate which budget category is returned.
 
         format examples: cat
-                         cat1,date1;cat2,date2;...;catN
+                         cat1,yyyymm1;cat2,yyyymm2;...;catN
         The assumption is that each succeeding date is later than the
         preceding ones and that the last category applies to all later dates
 
@@ -104,49 +134,34 @@ class TransferMonthlyFilesToDB(object):
         :param str budget_date: the budget date string
         :rtype: str
         """
-        bud_date = datetime.datetime.strptime(budget_date, "%m/%d/%Y").date()
+        bud_day = day_ordinal(budget_date)
 
-        # Match PAYROLL, IGNORE, and TRANSFER budget categories
-        for key in self.payroll_ignore_transfer_dict:
-            if key in payee:
-                category = self.payroll_ignore_transfer_dict[key]
-                self.logger.log(f"Payee '{payee}' match '{key}' with category '{category}'")
-                return category
+        # Match PAYROLL, IGNORE, and TRANSFER budget categories. The first key in the json file that
+        # occurs in the payee wins.
+        key = self.payroll_ignore_transfer_matcher.first_match(payee)
+        if key is not None:
+            category = self.payroll_ignore_transfer_dict[key]
+            self.logger.debug(f"Payee '{payee}' match '{key}' with category '{category}'")
+            return category
 
-        self.logger.log(f"No payroll/ignore/transfer match found in '{payee}'")
+        self.logger.debug(f"No payroll/ignore/transfer match found in '{payee}'")
         if 'transfer' in payee.lower():
             return 'TRANSFER'
 
         #
-        # If not a standard, hard-coded budget category, try looking up in the payee DATABASE dictionary
-        for key in sorted(self.payee_dict):
-            match_object = re.match(self.payee_dict[key][0], payee, re.I)
-            if match_object:
-                cats = self.payee_dict[key][1].split(';')
-                if len(cats) == 1:
-                    self.logger.log('1 Payee "{}" match "{}" with category "{}"'.
-                                    format(payee, self.payee_dict[key][0], cats[0]))
-                    return cats[0]
-                else:
-                    i = 0
-                    while i < len(cats):
-                        if len(cats[i].split(',')) == 2:
-                            (cat, cat_date_string) = cats[i].split(',')
-                            cat_date_string = cat_date_string+'31'
-                            cat_date = datetime.datetime.strptime(cat_date_string, '%Y%m%d').date()
-                            if bud_date <= cat_date:
-                                self.logger.log('2 Payee "{}" match "{}" with category "{}"'.
-                                                format(payee, self.payee_dict[key][0], cats[0]))
-                                return cat
-                            else:
-                                i += 1
-                        else:
-                            # the last category is the most recent
-                            self.logger.log('3 Payee "{}" match "{}" with category "{}"'.
-                                            format(payee, self.payee_dict[key][0], cats[-1]))
-                            return cats[i]
+        # If not a standard, hard-coded budget category, try looking up in the payee DATABASE dictionary.
+        # The matcher finds the first matching rule in payee file order in a single pass. A dated rule whose
+        # last date is earlier than the budget date does not apply, so keep looking from the next rule.
+        rule_index = self.payee_matcher.match(payee)
+        while rule_index is not None:
+            category = self.payee_matcher.timelines[rule_index].category_for(bud_day)
+            if category is not None:
+                self.logger.debug('Payee "{}" match "{}" with category "{}"'.
+                                format(payee, self.payee_matcher.rules[rule_index][0], category))
+                return category
+            rule_index = self.payee_matcher.match(payee, rule_index + 1)
 
         #
         # If all else fails, return the default
-        self.logger.log('Payee "' + payee + '" no match found')
+        self.logger.debug('Payee "' + payee + '" no match found')
         return self.DEFAULT_BUDGET_CATEGORY
@@ -2,6 +2,40 @@
 
 import sys
 import collections
+import money
+from transaction import Transaction
+from downloadDates import parse_date
+
+
+class MalformedLineError(ValueError):
+    """A download file line that cannot be tokenized, such as one with an unclosed double-quote
+
+    :param int line_num: the line number in the file (1-based)
+    :param str line: the offending line
+    """
+    def __init__(self, line_num, line):
+        super().__init__(f"Improperly formed line {line_num}: opening \" but no closing \" in line\n{line}")
+        self.line_num = line_num
+        self.line = line
+
+
+def _replace_commas_in_quotes(replace_char, line):
+    """Replace all commas inside double-quotes with replace_char and remove the double-quotes, in one pass.
+    Return None if a double-quote is not closed.
+
+    :param str replace_char: the character to replace the bad comma
+    :param str line: the line containing the potentially bad comma(s)
+    :rtype: str|None
+    """
+    if '"' not in line:
+        return line
+    # splitting on the quotes puts every quoted section at an odd index
+    parts = line.split('"')
+    if len(parts) % 2 == 0:  # odd number of quotes: the last one is not closed
+        return None
+    for i in range(1, len(parts), 2):
+        parts[i] = parts[i].replace(',', replace_char)
+    return ''.join(parts)
 
 
 def clear_commas_in_quotes(replace_char, line):
@@ -12,39 +46,59 @@ def clear_commas_in_quotes(replace_char, line):
     :param str line: the line containing the potentially bad comma(s)
     :rtype: str
     """
-    start = 0
-    while line.find('"', start) != -1:
-        idx1 = line.find('"', start)  # index of opening quote
-        if idx1 == -1:
-            break
-        idx2 = line.find('"', idx1+1)  # index of closing quote
-        if idx2 == -1:  # Didn't find a closing quote? Barf
-            print(f"Improperly formed line: opening \" but no closing \" in line\n{line}")
-            sys.exit(1)
-
-        # replace all found commas with replace_char within the opening and closing quotes
-        while True:
-            comma_index = line.find(',', idx1, idx2)
-            if comma_index >= 0:  # replace found comma with replacement char
-                line = line[:comma_index] + replace_char + line[comma_index + 1:]
-            else:  # found all commas (or there were none)
-                break
-
-        # move after closing quote to begin another search for an opening quote
-        start = idx2 + 1
-    # now line is clear of confusing commas
-    line = line.replace('"', '')  # remove all double-quotes
-    return line
-
-
-def process_budget_fields(extra_field, transaction_amount, default_category, transaction_date, transaction_reference):
+    cleared_line = _replace_commas_in_quotes(replace_char, line)
+    if cleared_line is None:  # Didn't find a closing quote? Barf
+        print(f"Improperly formed line: opening \" but no closing \" in line\n{line}")
+        sys.exit(1)
+    return cleared_line
+
+
+def tokenize_download_file(file_ptr, replace_char=' ', malformed=None):
+    """Read a comma-separated download file and yield the fields of each non-blank line.
+
+    Each line is stripped, commas inside double-quotes are replaced with replace_char, double-quotes are
+    removed, and any in-line comment starting with '//' is split off. Yields tuples of
+    (line number, list of fields, comment), where the comment keeps its leading '//' or is ''.
+
+    A line with an unclosed double-quote raises MalformedLineError, unless a malformed list is given, in
+    which case the MalformedLineError is appended to it and the line is skipped.
+
+    :param Iterable[str] file_ptr: the open file (or any iterable of lines)
+    :param str replace_char: the character to replace commas inside double-quotes (default = ' ')
+    :param list malformed: collects the malformed lines instead of raising (optional)
+    :rtype: Iterator[(int, list[str], str)]
+    """
+    for line_num, line in enumerate(file_ptr, 1):
+        line = line.strip()
+        if not line:
+            continue  # ignore blank lines
+
+        cleared_line = _replace_commas_in_quotes(replace_char, line)
+        if cleared_line is None:
+            error = MalformedLineError(line_num, line)
+            if malformed is None:
+                raise error
+            malformed.append(error)
+            continue
+
+        # Look for in-line comments, strip them from the line, but keep them for later
+        comment = ''
+        idx = cleared_line.find('//')
+        if idx >= 0:
+            comment = cleared_line[idx:]
+            cleared_line = cleared_line[:idx]
+
+        yield line_num, cleared_line.split(','), comment
+
+
+def process_budget_fields(extra_field, transaction_cents, default_category, transaction_date, transaction_reference):
     """Process the budget fields in the payee file (???)
-    Returns a dictionary of the payee file
+    Returns a dictionary of the payee file, with each line as [category, amount in cents, date]
 
     Each field in extra_field can be like: 'BUDCAT[=BUDAMT[=BUDDATE]]', or 'DATE=<BUDDATE>'
 
     :param list[str] extra_field:
-    :param str transaction_amount:
+    :param int transaction_cents: the transaction amount in cents
     :param str default_category:
     :param str transaction_date:
     :param str transaction_reference:
@@ -87,63 +141,48 @@ def process_budget_fields(extra_field, transaction_amount, default_category, tra
     budget_dict[idx] = [budget_category, budget_amount, budget_date]
 
     # finish processing missing budget info with (calculated) defaults
-    tran_amt_isneg = float(transaction_amount) < 0.0
-
-    # remainder is a double and is always POSITIVE
-    remainder = abs(float(transaction_amount))
-
-    # for key, val in collections.OrderedDict(sorted(budget_dict.items())).iteritems():
-    for key in budget_dict:
+    line_cents = [money.parse_cents(budget_dict[key][1]) if budget_dict[key][1] else None for key in budget_dict]
+    amounts, over_assigned = money.split_cents(transaction_cents, line_cents)
+    if over_assigned:  # something didn't add up
+        print(f"Calculating amounts for {list(budget_dict.values())} and the budget amounts are more than the "
+              f"transaction amount (transaction_reference={transaction_reference}, extra "
+              f"fields={','.join(extra_field)})")
+
+    for key, cents in zip(budget_dict, amounts):
         if not budget_dict[key][0]:
             budget_dict[key][0] = default_category  # default
-
-        # The assumption is that all budget amounts are positive, but use
-        # the same sign as the transaction amount
-        if not budget_dict[key][1]:  # no budget amount?
-            # assign any remainder to it
-            budget_dict[key][1] = '%.2f' % (-1.0*remainder if tran_amt_isneg else remainder)
-            remainder = 0.0
-        else:  # otherwise decrement remainder by the budget amount
-            # keep track of the remainder
-            remainder = remainder - float(budget_dict[key][1])
-            if tran_amt_isneg and not budget_dict[key][1].startswith('-'):
-                budget_dict[key][1] = '-'+budget_dict[key][1]
-            if remainder < 0.0:  # something didn't add up
-                remainder = 0.0
-                print(f"Calculating amount for {budget_dict[key]} and got a remainder less than zero (transaction_"
-                      f"reference={transaction_reference}, extra fields={','.join(extra_field)})")
-        # end if
+        budget_dict[key][1] = cents
         if not budget_dict[key][2]:  # no budget date?
             budget_dict[key][2] = transaction_date  # assign transaction date
-    # end for
     return budget_dict
 
 
 def insert_entry_into_dict(budget_dict, transaction_reference, transaction_date,
                            transaction_payee, transaction_check_num, transaction_type,
-                           transaction_amount, transaction_comment, output_dict):
-    """Insert the transaction (possibly multi-budget) in to the output_dict dictionary
+                           transaction_cents, transaction_comment, output_dict):
+    """Insert the transaction (possibly multi-budget) in to the output_dict dictionary as Transaction records
 
-    :param dict budget_dict:
+    :param dict budget_dict: the budget lines as [category, amount in cents, date]
     :param str transaction_reference:
     :param str transaction_date:
     :param str transaction_payee:
     :param str transaction_check_num:
     :param str transaction_type:
-    :param str transaction_amount:
+    :param int transaction_cents: the transaction amount in cents
     :param str transaction_comment:
     :param dict output_dict:
     :return:
     """
+    # the transaction date is the same for every line, so only parse it once
+    tran_date = parse_date(transaction_date)
     if len(budget_dict) == 1:  # there is only one line for this transaction
         bud = budget_dict[0]
-        output_dict[transaction_reference] = [transaction_date, transaction_reference,
-                                              transaction_payee, transaction_check_num,
-                                              transaction_type, transaction_amount,
-                                              bud[0], bud[1], bud[2], transaction_comment]
+        output_dict[transaction_reference] = Transaction(
+            tran_date, transaction_reference, transaction_payee, transaction_check_num, transaction_type,
+            transaction_cents, bud[0], bud[1], parse_date(bud[2]) if bud[2] else None, transaction_comment)
     else:
         for key, bud in collections.OrderedDict(sorted(budget_dict.items())).items():
             my_key = transaction_reference + '-' + str(key)
-            output_dict[my_key] = [transaction_date, transaction_reference, transaction_payee,
-                                   transaction_check_num, transaction_type, transaction_amount,
-                                   bud[0], bud[1], bud[2], transaction_comment]
+            output_dict[my_key] = Transaction(
+                tran_date, transaction_reference, transaction_payee, transaction_check_num, transaction_type,
+                transaction_cents, bud[0], bud[1], parse_date(bud[2]) if bud[2] else None, transaction_comment)
@@ -1,5 +1,6 @@
 import sys
 import transferUtils
+import money
 
 
 class Mixin(object):
@@ -50,8 +51,8 @@ class Mixin(object):
                 # parse the transaction reference
                 trans_ref = field[1].split()[1]
 
-                # transaction amount
-                trans_amt = field[2]
+                # transaction amount in cents
+                trans_cents = money.parse_cents(field[2])
 
                 # transaction payee
                 trans_payee = field[3]
@@ -63,12 +64,12 @@ class Mixin(object):
                 # process the extra budget fields which may mean extra DATABASE
                 # records
                 budget_category_dict = transferUtils.process_budget_fields(field[expected_fields:],
-                                                                           trans_amt, bud_cat,
+                                                                           trans_cents, bud_cat,
                                                                            trans_date, trans_ref)
 
                 # insert the record(s) into the dictionary
                 transferUtils.insert_entry_into_dict(budget_category_dict, trans_ref, trans_date,
-                                                     trans_payee, '', 'x', trans_amt, comment,
+                                                     trans_payee, '', 'x', trans_cents, comment,
                                                      output_dict)
                 line_num += 1
                 # end for
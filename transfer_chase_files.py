@@ -1,5 +1,6 @@
 import sys
 import transferUtils
+import money
 import transferFilesToDB
 
 
@@ -50,8 +51,8 @@ class ChaseMixin(object):
                 # The reference will be the entire line stripped of commas and spaces
                 trans_ref = line.replace(',', '').replace(' ', '')
 
-                # transaction amount
-                trans_amt = fields[3]
+                # transaction amount in cents
+                trans_cents = money.parse_cents(fields[3])
 
                 # transaction payee
                 # strip out extra spaces
@@ -64,11 +65,12 @@ class ChaseMixin(object):
                 # process the extra budget fields which may mean extra DATABASE
                 # records
                 budget_category_dict = transferUtils.process_budget_fields(
-                    fields[expected_fields:], trans_amt, bud_cat, trans_date, trans_ref)
+                    fields[expected_fields:], trans_cents, bud_cat, trans_date, trans_ref)
 
                 # insert the record(s) into the dictionary
                 transferUtils.insert_entry_into_dict(
-                    budget_category_dict, trans_ref, trans_date, trans_payee, '', 'c', trans_amt, comment, output_dict)
+                    budget_category_dict, trans_ref, trans_date, trans_payee, '', 'c', trans_cents, comment,
+                    output_dict)
                 line_num += 1
                 # end for
         self.logger.log('read_monthly_chase_file processed {} records from {}\n'.
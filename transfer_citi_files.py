@@ -1,10 +1,14 @@
 import datetime
-import json
 import hashlib
 import transferUtils
+import money
 import transferFilesToDB
-import header as h
+import downloadFormats
 from utils import Logger
+from downloadDates import parse_date
+
+# Citi format v3 records before this date were already inserted with a different transaction ID
+FORMAT_V3_START_DATE = datetime.date(2019, 1, 1)
 
 
 def read_monthly_citi_file(file_name, transfer, logger):
@@ -53,9 +57,9 @@ def read_monthly_citi_file(file_name, transfer, logger):
     tech guys.
     '''
 
-    header = h.Header(json_file="citi_download_format.json")
-    with open("map_download_to_db.json", "r") as f:
-        field_map = json.load(f)['citi']
+    source = downloadFormats.get_source('citi')
+    header = source.header
+    field_map = source.field_map
 
     line_num = 0
     expected_fields = header.num_fields
@@ -66,41 +70,11 @@ def read_monthly_citi_file(file_name, transfer, logger):
 
     with open(file_name, "r") as file_ptr:
         line_num = 0
-        line = file_ptr.readline()
-        while line:
-            # Older versions of citi download files would sometimes split each line in two. So
-            # we had to join them back together.
-            #
-            # Check for normal end-of-line characters. If not, read the next line and join together.
-            # if ord(line[-2]) != 13 and ord(line[-1]) == 10:
-            #     print('Jacked line: "{}" {}-{}'.format(line, ord(line[-2]), ord(line[-1])))
-            #     line2 = file_ptr.readline()  # read in the next line
-            #     line = line[:-1] + line2  # strip off last char of first line and join to 2nd line
-            #     print('\nJoined: {}'.format(line.strip()))
-            # else:
-            #     print('\nNormal: {}'.format(line.strip()))
-            logger.log(f"Normal: {line.strip()}")
-
-            # strip all leading and trailing spaces and new-lines
-            line = line.strip()
-
-            # ignore blank lines
-            if not line:
-                line = file_ptr.readline()
-                continue
-
-            # Clear any commas inside quoted fields and strip remaining " characters
-            line = transferUtils.clear_commas_in_quotes('', line)
-
-            # Look for in-line comments and keep them
-            comment = ''
-            idx = line.find('//')
-            if idx >= 0:
-                comment = line[idx+2:]
-                line = line[:idx]
-
-            # split the line into fields (comma-separated)
-            fields = line.split(',')
+        # Older versions of citi download files would sometimes split each line in two, and they had to be
+        # joined back together. That no longer happens.
+        for _, fields, comment in transferUtils.tokenize_download_file(file_ptr, replace_char=''):
+            comment = comment[2:]  # keep the comment without the leading '//'
+            logger.debug(f"Normal: {','.join(fields)}")
 
             # Validate the header field names
             if line_num == 0:
@@ -117,7 +91,6 @@ def read_monthly_citi_file(file_name, transfer, logger):
                     logger.log('###############################################')
                     raise
 
-                line = file_ptr.readline()
                 line_num += 1
                 continue
 
@@ -128,7 +101,6 @@ def read_monthly_citi_file(file_name, transfer, logger):
             # To prevent this, only consider Cleared transactions which by assumption do not change
             # over time.
             if 'pending' in fields[field_map['status']].lower():
-                line = file_ptr.readline()
                 line_num += 1
                 continue
 
@@ -141,11 +113,8 @@ def read_monthly_citi_file(file_name, transfer, logger):
             # don't parse or insert format_v3 Citi records transacted before 1/1/2019
             # This prevents double records since the payee field has changed and therefore the
             # calculated trans_ref field will be different.
-            datefields = [int(n) for n in trans_date.split('/')]
-            trans_date_object = datetime.date(datefields[2], datefields[0], datefields[1])
-            if format_v3 and trans_date_object < datetime.date(2019, 1, 1):
+            if format_v3 and parse_date(trans_date) < FORMAT_V3_START_DATE:
                 logger.log("Citi card records transacted prior to 1 Jan 2019 are not processed")
-                line = file_ptr.readline()
                 line_num += 1
                 continue
 
@@ -180,21 +149,21 @@ def read_monthly_citi_file(file_name, transfer, logger):
             # value
             hash_key = trans_date+trans_amt+trans_payee+fields[field_map['member']]
             trans_ref = hashlib.md5(hash_key.encode('utf-8')).hexdigest()
-            logger.log(f"{hash_key} => {trans_ref}")
+            logger.debug(f"{hash_key} => {trans_ref}")
 
-            logger.log(f"Citi transaction {trans_payee} matches to category {bud_cat}\n")
+            logger.debug(f"Citi transaction {trans_payee} matches to category {bud_cat}\n")
 
             # process the extra budget fields which may mean extra DATABASE records
+            trans_cents = money.parse_cents(trans_amt)
             budget_category_dict = transferUtils.process_budget_fields(
-                fields[expected_fields:], trans_amt, bud_cat, trans_date, trans_ref)
+                fields[expected_fields:], trans_cents, bud_cat, trans_date, trans_ref)
 
             # insert the record(s) into the dictionary
             transferUtils.insert_entry_into_dict(
-                budget_category_dict, trans_ref, trans_date, trans_payee, '', trans_type, trans_amt, comment,
+                budget_category_dict, trans_ref, trans_date, trans_payee, '', trans_type, trans_cents, comment,
                 output_dict)
             line_num += 1
-            line = file_ptr.readline()
-        # end while
+        # end for each line
     # end with open(...
 
     logger.log(f"read_monthly_citi_file processed {line_num} records from {file_name}\n")
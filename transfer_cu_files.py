@@ -1,9 +1,13 @@
-import json
+import downloadFormats
 import transferUtils
-import header as h
-from datetime import datetime
+import money
+import datetime
 from utils import Logger
 import transferFilesToDB
+from downloadDates import parse_date
+
+# The first transaction date that uses the "Transaction ID" field as the transaction ID
+TRANSACTION_ID_START_DATE = datetime.date(2021, 9, 1)
 
 
 def read_monthly_cu_file(file_name, transfer, logger):
@@ -71,9 +75,9 @@ def read_monthly_cu_file(file_name, transfer, logger):
     #      "TranDesc" and "ExtDesc"
     # The later records split the old Description field into TranDesc and ExtDesc, leaving the
     #   Description field the same as before
-    with open("map_download_to_db.json", "r") as f:
-        field_map = json.load(f)['cu']
-    header = h.Header(json_file='cu_download_format.json')
+    source = downloadFormats.get_source('cu')
+    field_map = source.field_map
+    header = source.header
     trans_type = field_map['type']
 
     line_num = 0
@@ -87,25 +91,9 @@ def read_monthly_cu_file(file_name, transfer, logger):
     index_reference_id = field_map['reference']
 
     with open(file_name, "r") as file_ptr:
-        for line in file_ptr:
+        for _, fields, comment in transferUtils.tokenize_download_file(file_ptr):
             desc = ''
             bud_cat = ''
-            line = line.strip()
-            if not line:
-                continue  # ignore blank lines
-
-            # Clear any commas inside quoted fields, and strip all " chars from line
-            line = transferUtils.clear_commas_in_quotes(' ', line)
-
-            # Look for in-line comments, strip them from the line, but keep them for later
-            comment = ''
-            idx = line.find('//')
-            if idx >= 0:
-                comment = line[idx:]
-                line = line[:idx]
-
-            # split the line into comma-separated fields
-            fields = line.split(',')
 
             #
             # First line stuff
@@ -142,9 +130,7 @@ def read_monthly_cu_file(file_name, transfer, logger):
             # records already inserted into the database which messes things up. Starting 9/1/2021 we will start
             # using "Transaction ID" field (stripped of commas and spaces) as the transaction ID. There appears to
             # be a serial number embedded in that field (last 5 digits).
-            trans_datetime = datetime.strptime(trans_date, "%m/%d/%Y")
-            sept_2021 = datetime.strptime("9/1/2021", "%m/%d/%Y")
-            if trans_datetime >= sept_2021:
+            if parse_date(trans_date) >= TRANSACTION_ID_START_DATE:
                 tid = fields[index_transaction_id].replace(' ', '')
             else:
                 tid = fields[index_reference_id]
@@ -154,10 +140,9 @@ def read_monthly_cu_file(file_name, transfer, logger):
             check_num = ''
             transaction_payee = fields[index_payee]
 
-            tamt = float(fields[index_transaction_amount])
+            transaction_cents = money.parse_cents(fields[index_transaction_amount])
             if field_map['negate']:
-                tamt *= -1.0
-            transaction_amount = f"{tamt:.2f}"
+                transaction_cents = -transaction_cents
 
             budget_category_dict = dict()
             if fields[index_transaction_check_num]:  # a check
@@ -181,12 +166,10 @@ def read_monthly_cu_file(file_name, transfer, logger):
                 # defaults to 'UNKNOWN'
                 bud_cat = transfer.lookup_payee_category(transaction_payee, trans_date)
 
-                # set the default budget date and amount from the transaction date and amount
-                bud_amt = transaction_amount
-
-                # process the extra budget fields which may mean extra DATABASE records
+                # process the extra budget fields which may mean extra DATABASE records. The budget date and
+                # amount default to the transaction date and amount.
                 budget_category_dict = transferUtils.process_budget_fields(
-                    fields[expected_fields:], bud_amt, bud_cat, trans_date, tid)
+                    fields[expected_fields:], transaction_cents, bud_cat, trans_date, tid)
 
             transferUtils.insert_entry_into_dict(
                 budget_category_dict,
@@ -195,7 +178,7 @@ def read_monthly_cu_file(file_name, transfer, logger):
                 desc if check_num else transaction_payee,
                 check_num,
                 trans_type,
-                transaction_amount,
+                transaction_cents,
                 comment,
                 output_dict)
             line_num += 1
@@ -1,7 +1,7 @@
 import sys
-import json
+import downloadFormats
 import transferUtils
-import header as h
+import money
 from utils import Logger
 import transferFilesToDB
 
@@ -23,9 +23,9 @@ def read_monthly_discover_file(file_name, transfer, logger):
     # while two or more transactions occur on the same day to the same payee for the same amount and
     # then they have to be distinguished. This is problematic.
 
-    header = h.Header(json_file="discover_download_format.json")
-    with open("map_download_to_db.json", "r") as f:
-        field_map = json.load(f)['discover']
+    source = downloadFormats.get_source('discover')
+    header = source.header
+    field_map = source.field_map
 
     line_num = 0
     expected_fields = header.num_fields
@@ -34,29 +34,13 @@ def read_monthly_discover_file(file_name, transfer, logger):
     trans_type = field_map['type']
 
     with open(file_name, "r") as file_ptr:
-        for line in file_ptr:
-            line = line.strip()
-
-            # ignore blank lines
-            if not line:
-                continue
-
-            # Clear any commas inside quoted fields and strip any " characters
-            line = transferUtils.clear_commas_in_quotes(' ', line)
-
-            # Look for in-line comments and keep them
-            comment = ''
-            idx = line.find('//')
-            if idx >= 0:
-                comment = line[idx+2:]
-                line = line[:idx]
-
-            fields = line.split(',')
+        for _, fields, comment in transferUtils.tokenize_download_file(file_ptr):
+            comment = comment[2:]  # keep the comment without the leading '//'
 
             # first line is header line
             if line_num == 0:
                 # This is the file when there are no transactions in the given period
-                if line.startswith('There are no statements'):
+                if fields[0].startswith('There are no statements'):
                     return output_dict
 
                 try:
@@ -84,9 +68,10 @@ def read_monthly_discover_file(file_name, transfer, logger):
             # parse the transaction amount
             # Discover reverses the sign of the amounts: no sign (positive)
             # for debits, - for credits -- we reverse it to preserve
-            # consistency across accounts
-            trans_amt_float = float(fields[field_map['amount']])
-            trans_amt_string = '%.2f' % -trans_amt_float
+            # consistency across accounts. The reference was first built from the amount formatted as a float,
+            # which gave a 0 amount as '-0.00'.
+            trans_cents = -money.parse_cents(fields[field_map['amount']])
+            trans_amt_string = money.format_cents(trans_cents) if trans_cents else '-0.00'
 
             # parse the transaction reference
             # some work here to get the dates in the right order and format
@@ -117,15 +102,15 @@ def read_monthly_discover_file(file_name, transfer, logger):
             # Lookup the default budget category from the payee DATABASE
             # defaults to 'UNKNOWN'
             bud_cat = transfer.lookup_payee_category(trans_payee, trans_date)
-            logger.log(f"Discover transaction {trans_payee} matches to category {bud_cat}\n")
+            logger.debug(f"Discover transaction {trans_payee} matches to category {bud_cat}\n")
 
             # process the extra budget fields which may mean extra DATABASE records
             budget_category_dict = transferUtils.process_budget_fields(
-                fields[expected_fields:], trans_amt_string, bud_cat, trans_date, trans_ref)
+                fields[expected_fields:], trans_cents, bud_cat, trans_date, trans_ref)
 
             # insert the record(s) into the dictionary
             transferUtils.insert_entry_into_dict(
-                budget_category_dict, trans_ref, trans_date, trans_payee, '', trans_type, trans_amt_string, comment,
+                budget_category_dict, trans_ref, trans_date, trans_payee, '', trans_type, trans_cents, comment,
                 output_dict)
             line_num += 1
         # end for line in
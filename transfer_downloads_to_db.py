@@ -1,79 +1,102 @@
-import hashlib
-import json
 import transferUtils
-import header as h
-from datetime import datetime
+import downloadFormats
+import ofxReader
+from ingestJournal import LineFingerprinter
+from stageTimer import NULL_TIMER
+from downloadDates import parse_date
 from utils import Logger
 import transferFilesToDB
 
 
-def convert_downloads_file(download_file, map_file, format_file, key, transfer, logger):
+def download_date_range(download_file, map_file, key):
+    """Return the earliest and latest transaction dates in a download file, or None if it has no dated rows.
+    This is a quick scan of the date columns only; lines that don't parse are left for the real conversion
+    to report.
+
+    :param str download_file: name of the download file
+    :param str map_file: name of the map file
+    :param str key: identifying key in map file. Currently 'cu', 'citi', 'discover'
+    :rtype: (date, date)|None
+    """
+    field_map = downloadFormats.get_source(key, map_file=map_file).field_map
+    date_indices = [field_map[fld] for fld in ('date', 'date2') if fld in field_map]
+
+    first_date = None
+    last_date = None
+    with open(download_file, "r") as file_ptr:
+        lines = transferUtils.tokenize_download_file(file_ptr, malformed=[])
+        next(lines, None)  # skip the header line
+        for _, fields, _ in lines:
+            for index in date_indices:
+                try:
+                    tran_date = parse_date(fields[index].split(' ')[0])
+                except (IndexError, ValueError):
+                    continue
+                if first_date is None or tran_date < first_date:
+                    first_date = tran_date
+                if last_date is None or tran_date > last_date:
+                    last_date = tran_date
+    return None if first_date is None else (first_date, last_date)
+
+
+def convert_downloads_file(download_file, map_file, format_file, key, transfer, logger, known_keys=None,
+                           counters=None, seen_lines=None, new_lines=None, timer=None):
     """Read in the downloads file line-by-line, and insert transactions in a dictionary
     Return the dictionary with the downloaded transactions.
 
+    If known_keys is given, rows whose transaction ID is already in it are dropped as soon as the ID is
+    known, before the payee lookup and budget field processing. Dropped rows are counted in
+    counters['already_in_db'] if counters is given.
+
+    If seen_lines is given, data lines whose ingest journal fingerprint is in it are skipped without being
+    processed and counted in counters['skipped_by_journal']. If new_lines is given, the fingerprint of each
+    data line is added to it, mapped to the line's transaction ID, or to None if the line was skipped as
+    already in the journal. Pending lines are left out, since they are not written to the database.
+
+    If timer is given, the wall time and number of rows of each processing stage are added to it.
+
     :param str download_file: name of the download file
     :param str map_file: name of the map file
     :param str format_file: name of the format file
     :param str key: identifying key in map file. Currently 'cu', 'citi', 'discover'
     :param transferFilesToDB.TransferMonthlyFilesToDB transfer: required object method
     :param Logger logger: logging method
+    :param set known_keys: transaction IDs already in the database (optional)
+    :param dict counters: run statistics to update (optional)
+    :param set seen_lines: ingest journal fingerprints of lines already written to the database (optional)
+    :param dict new_lines: collects the fingerprints of the lines and their transaction IDs (optional)
+    :param stageTimer.StageTimer timer: records the time spent in each stage (optional)
     :rtype: dict
     """
-    with open("supported_downloads.json", "r") as f:
-        supported = json.load(f)
-    assert key in supported, f"Key '{key}' not found in supported_downloads '{supported}'"
-    with open(map_file, "r") as f:
-        field_maps = json.load(f)
-    assert key in field_maps, f"Key '{key}' not found in map file {map_file}"
-    field_map = field_maps[key]
-    header = h.Header(json_file=format_file)
+    if timer is None:
+        timer = NULL_TIMER
+    timer.start()
+    # The formats and field maps are loaded and checked once per process
+    source = downloadFormats.get_source(key, map_file=map_file, format_file=format_file)
+    field_map = source.field_map
+    header = source.header
     transaction_type = field_map['type']
 
     line_num = 0
+    already_in_db = 0
+    skipped_by_journal = 0
+    fingerprinter = LineFingerprinter()
     expected_fields = header.num_fields
     output_dict = {}
     index_transaction_date = field_map['date']
-    if 'tid' in field_map:
-        index_transaction_id = field_map['tid']
-    else:
-        index_transaction_id = None
     if 'check' in field_map:
         index_transaction_check_num = field_map['check']
     else:
         index_transaction_check_num = None
-    if 'status' in field_map:
-        index_status = field_map['status']
-    else:
-        index_status = None
-    if 'credit' in field_map and 'debit' in field_map:
-        index_transaction_amount = None
-        index_transaction_credit = field_map['credit']
-        index_transaction_debit = field_map['debit']
-    else:
-        index_transaction_amount = field_map['amount']
-        index_transaction_credit = None
-        index_transaction_debit = None
+    # the status filter, amount and transaction ID steps, compiled from the field map
+    is_pending, parse_amount, build_transaction_id = source.converter
     index_payee = field_map['payee']
+    timer.lap('setup')
 
     with open(download_file, "r") as file_ptr:
-        for line in file_ptr:
+        for _, fields, comment in transferUtils.tokenize_download_file(file_ptr):
+            timer.lap('tokenize')
             bud_cat = ''
-            line = line.strip()
-            if not line:
-                continue  # ignore blank lines
-
-            # Clear any commas inside quoted fields, and strip all " chars from line
-            line = transferUtils.clear_commas_in_quotes(' ', line)
-
-            # Look for in-line comments, strip them from the line, but keep them for later
-            comment = ''
-            idx = line.find('//')
-            if idx >= 0:
-                comment = line[idx:]
-                line = line[:idx]
-
-            # split the line into comma-separated fields
-            fields = line.split(',')
 
             #
             # Validate first line/header
@@ -92,17 +115,32 @@ def convert_downloads_file(download_file, map_file, format_file, key, transfer,
                     logger.log('###############################################')
                     raise
                 line_num += 1
+                timer.lap('validate_header')
                 continue
             #
             # Process all other lines
             #
+            if seen_lines is not None or new_lines is not None:
+                fingerprint = fingerprinter.fingerprint(fields, comment)
+                if seen_lines is not None and fingerprint in seen_lines:
+                    if new_lines is not None:
+                        new_lines[fingerprint] = None
+                    skipped_by_journal += 1
+                    line_num += 1
+                    timer.lap('journal')
+                    continue
+                timer.lap('journal')
+
             header.validate_data_field_values(fields)
+            timer.lap('validate_row')
 
             # some download files have a "status" field which indicates if transaction is pending or cleared
             # skip "pending" transactions
-            if index_status and fields[index_status].lower() == 'pending':
+            if is_pending is not None and is_pending(fields):
                 line_num += 1
+                timer.lap('status_filter')
                 continue
+            timer.lap('status_filter')
 
             # transaction date
             transaction_date = fields[index_transaction_date]
@@ -110,54 +148,26 @@ def convert_downloads_file(download_file, map_file, format_file, key, transfer,
             # payee
             transaction_payee = fields[index_payee]
 
-            # amount
-            # some download files split the transaction amount into a "credit" field or a "debit" field
-            if index_transaction_amount is not None:
-                tamt = float(fields[index_transaction_amount])
-            else:
-                tamt = float(fields[index_transaction_credit] if fields[index_transaction_credit] else
-                             fields[index_transaction_debit])
-            if field_map['negate']:
-                tamt *= -1.0
-            transaction_amount = f"{tamt:.2f}"
+            # amount in cents
+            transaction_cents = parse_amount(fields)
+            timer.lap('amount')
 
             # transaction ID
-            # Some financial institutions include a unique ID field for each transaction in their download.
-            # If there is one for this download, use it. Otherwise create a unique ID by combining the specified
-            # fields together from the field_map, and optionally converting it to an md5 checksum.
-            if index_transaction_id is not None:
-                transaction_id = fields[index_transaction_id]
-            else:
-                tid = ""
-                for fld in field_map['tid_fields']:
-                    if fld == "date" and 'tid_date_format' not in field_map:
-                        tid += transaction_date
-                    elif fld == "amount":
-                        tid += transaction_amount
-                    elif fld == "payee":
-                        tid += transaction_payee
-                    else:  # use whatever field specified - unique to each field map
-                        assert fld in field_map, f"Key field '{fld}' not found in field_map for {key}"
-                        # Some downloads have more than one date, such as Discover card which has "Trans. Date", and
-                        # "Post Date" and use all the dates in their transaction ID. Right now we assume the original
-                        # date formats are always "mm/dd/yyyy". Future enhancement will allow specification of
-                        # original date formats. Right now there are only 2 supported reformatted date formats.
-                        if fld.startswith('date') and 'tid_date_format' in field_map:
-                            assert field_map['tid_date_format'] in ["yyyymmdd", "mmddyyyy"], (
-                                f"tid_date_format {field_map['tid_date_format']} must be one of 'yyyymmdd' or "
-                                f"'mmddyyyy'")
-                            date_arr = fields[field_map[fld]].split('/')
-                            if field_map['tid_date_format'] == 'yyyymmdd':
-                                tid += f"{date_arr[2]}{date_arr[0]}{date_arr[1]}"
-                            elif field_map['tid_date_format'] == 'mmddyyyy':
-                                tid += f"{date_arr[0]}{date_arr[1]}{date_arr[2]}"
-                        else:
-                            tid += fields[field_map[fld]]
-                if field_map['md5']:
-                    transaction_id = hashlib.md5(tid.encode('utf-8')).hexdigest()
-                else:
-                    transaction_id = tid
-            transaction_id = transaction_id.replace(' ', '')  # remove all spaces
+            # Either the download's own unique ID field for each transaction, or one made by combining the
+            # specified fields together from the field_map, and optionally converting it to an md5 checksum.
+            transaction_id = build_transaction_id(fields, transaction_date, transaction_cents, transaction_payee)
+            if new_lines is not None:
+                new_lines[fingerprint] = transaction_id
+            timer.lap('tid')
+
+            # Bank downloads overlap earlier downloads by weeks. Rows already in the database would be thrown
+            # away at insert time, so don't bother categorizing them.
+            if known_keys is not None and (transaction_id in known_keys or transaction_id + '-0' in known_keys):
+                already_in_db += 1
+                line_num += 1
+                timer.lap('known_keys')
+                continue
+            timer.lap('known_keys')
 
             check_num = ''
             desc = ''
@@ -177,6 +187,7 @@ def convert_downloads_file(download_file, map_file, format_file, key, transfer,
                 # no useful budget information.
                 desc = 'Check'
                 budget_category_dict[0] = ['XXX', 0, '']
+                timer.lap('check')
 
             # If the record is not a check, fill in the budget info from the payee DATABASE or
             # optional extra budget fields
@@ -184,13 +195,13 @@ def convert_downloads_file(download_file, map_file, format_file, key, transfer,
                 # Lookup the default budget category from the payee DATABASE
                 # defaults to 'UNKNOWN'
                 bud_cat = transfer.lookup_payee_category(transaction_payee, transaction_date)
+                timer.lap('payee_lookup')
 
-                # set the default budget date and amount from the transaction date and amount
-                bud_amt = transaction_amount
-
-                # process the extra budget fields which may mean extra DATABASE records
+                # process the extra budget fields which may mean extra DATABASE records. The budget date and
+                # amount default to the transaction date and amount.
                 budget_category_dict = transferUtils.process_budget_fields(
-                    fields[expected_fields:], bud_amt, bud_cat, transaction_date, transaction_id)
+                    fields[expected_fields:], transaction_cents, bud_cat, transaction_date, transaction_id)
+                timer.lap('budget_fields')
 
             transferUtils.insert_entry_into_dict(
                 budget_category_dict,
@@ -199,12 +210,93 @@ def convert_downloads_file(download_file, map_file, format_file, key, transfer,
                 desc if check_num else transaction_payee,
                 check_num,
                 transaction_type,
-                transaction_amount,
+                transaction_cents,
                 comment,
                 output_dict)
             line_num += 1
+            timer.lap('insert_dict')
         # end for each line
     # end with open
 
-    logger.log(f"convert_downloads_file processed {line_num} records from {download_file}\n")
+    timer.count('lines', line_num)
+    timer.count('already_in_db', already_in_db)
+    timer.count('skipped_by_journal', skipped_by_journal)
+    if counters is not None:
+        counters['already_in_db'] = counters.get('already_in_db', 0) + already_in_db
+        counters['skipped_by_journal'] = counters.get('skipped_by_journal', 0) + skipped_by_journal
+    logger.log(f"convert_downloads_file processed {line_num} records from {download_file} "
+               f"({already_in_db} already in database, {skipped_by_journal} skipped by ingest journal)\n")
+    return output_dict
+
+
+def convert_ofx_file(download_file, transaction_type, transfer, logger, known_keys=None, counters=None, timer=None):
+    """Read in an OFX/QFX download file transaction by transaction, and insert transactions in a dictionary
+    Return the dictionary with the downloaded transactions.
+
+    The file is streamed, so it can be of any size. The transaction IDs are the download's FITIDs, which
+    the banks keep the same from one download to the next. Otherwise the transactions are categorized and
+    inserted like the rows of convert_downloads_file, and known_keys, counters and timer work the same way.
+
+    :param str download_file: name of the OFX/QFX download file
+    :param str transaction_type: the transaction type of the records, e.g. 'y'
+    :param transferFilesToDB.TransferMonthlyFilesToDB transfer: required object method
+    :param Logger logger: logging method
+    :param set known_keys: transaction IDs already in the database (optional)
+    :param dict counters: run statistics to update (optional)
+    :param stageTimer.StageTimer timer: records the time spent in each stage (optional)
+    :raises ofxReader.OfxFormatError: if the file is not OFX or a transaction has a missing or bad field
+    :rtype: dict
+    """
+    if timer is None:
+        timer = NULL_TIMER
+    timer.start()
+    line_num = 0
+    already_in_db = 0
+    output_dict = {}
+    timer.lap('setup')
+
+    with open(download_file, "r") as file_ptr:
+        for transaction in ofxReader.iter_ofx_transactions(file_ptr):
+            timer.lap('tokenize')
+            transaction_id = transaction.tran_id
+            if known_keys is not None and (transaction_id in known_keys or transaction_id + '-0' in known_keys):
+                already_in_db += 1
+                line_num += 1
+                timer.lap('known_keys')
+                continue
+            timer.lap('known_keys')
+
+            if transaction.check_num:
+                # The check info resides in the checks table. The 'main' entry for the check has
+                # no useful budget information.
+                budget_category_dict = {0: ['XXX', 0, '']}
+                timer.lap('check')
+            else:
+                # Lookup the default budget category from the payee DATABASE
+                # defaults to 'UNKNOWN'
+                bud_cat = transfer.lookup_payee_category(transaction.tran_payee, transaction.tran_date)
+                timer.lap('payee_lookup')
+                budget_category_dict = transferUtils.process_budget_fields(
+                    [], transaction.amount_cents, bud_cat, transaction.tran_date, transaction_id)
+                timer.lap('budget_fields')
+
+            transferUtils.insert_entry_into_dict(
+                budget_category_dict,
+                transaction_id,
+                transaction.tran_date,
+                'Check' if transaction.check_num else transaction.tran_payee,
+                transaction.check_num,
+                transaction_type,
+                transaction.amount_cents,
+                '',
+                output_dict)
+            line_num += 1
+            timer.lap('insert_dict')
+
+    timer.count('lines', line_num)
+    timer.count('already_in_db', already_in_db)
+    if counters is not None:
+        counters['already_in_db'] = counters.get('already_in_db', 0) + already_in_db
+    logger.log(f"convert_ofx_file processed {line_num} records from {download_file} "
+               f"({already_in_db} already in database)\n")
     return output_dict
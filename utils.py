@@ -1,10 +1,46 @@
+import os
+import atexit
+import queue
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 
+# Log levels, lowest first. Messages below a logger's level are dropped.
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+# Queued to tell the writer thread to stop
+_STOP = object()
+
 
 class Logger(object):
-    def __init__(self, file_name, print_to_console=True, append=True):
-        self.log_file = open(file_name, ('a' if append else 'w'))
+    """Writes log messages to a file, and optionally the console, at or above a log level.
+
+    File writes are done by a background thread fed from a queue, so logging doesn't wait on disk I/O.
+    The thread writes whatever messages have queued up in one append, and everything queued is written
+    when the logger is flushed or closed, or the program exits. The file is opened in append mode at the
+    OS level, so each batch lands whole at the end of the file even when other processes log to it too.
+
+    :param str file_name: the log file name
+    :param bool print_to_console: also print messages to the console (default = True)
+    :param bool append: append to the log file instead of overwriting it (default = True)
+    :param int level: the lowest level of the messages to log (default = INFO)
+    :param int batch_size: the most messages to write in one append (default = 500)
+    """
+    def __init__(self, file_name, print_to_console=True, append=True, level=INFO, batch_size=500):
+        flags = os.O_WRONLY | os.O_CREAT | os.O_APPEND | (0 if append else os.O_TRUNC)
+        self._fd = os.open(file_name, flags, 0o644)
         self.print_to_console = print_to_console
+        self.level = level
+        self.batch_size = batch_size
+        self._pid = os.getpid()
+        self._queue = queue.Queue()
+        self._close_lock = threading.Lock()
+        self._writer = threading.Thread(target=self._write_loop, name=f"Logger({file_name})", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
 
         now_is = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         self.log('\n\n\n\n')
@@ -13,13 +49,114 @@ class Logger(object):
         self.log('*' * (len(now_is) + 18))
         self.log('\n\n')
 
-    def log(self, message):
+    def is_enabled_for(self, level):
+        """Return True if messages of the level are logged, e.g. to skip building expensive messages
+
+        :param int level: the log level
+        :rtype: bool
+        """
+        return level >= self.level
+
+    def log(self, message, level=INFO):
+        """Log the message if its level is at or above the logger's level
+
+        :param str message: the message
+        :param int level: the message's level (default = INFO)
+        """
+        if level < self.level:
+            return
         if self.print_to_console:
             print(message)
-        self.log_file.write(message + '\n')
+        if self._writer is not None and self._pid == os.getpid():
+            self._queue.put(message)
+        else:
+            # The logger was closed, or this is a forked child without the writer thread: write directly
+            self._write([message])
+
+    def debug(self, message):
+        """Log a trace message, only written when the logger's level is DEBUG
+
+        :param str message: the message
+        """
+        if self.level <= DEBUG:
+            self.log(message, DEBUG)
+
+    def _write(self, messages):
+        """Append the messages to the log file in one write
+
+        :param list[str] messages: the messages
+        """
+        data = ''.join(message + '\n' for message in messages).encode('utf-8')
+        while data:
+            data = data[os.write(self._fd, data):]
+
+    def _write_loop(self):
+        """Writer thread: write the queued messages in batches until told to stop"""
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = any(message is _STOP for message in batch)
+            messages = [message for message in batch if message is not _STOP]
+            try:
+                if messages:
+                    self._write(messages)
+            except OSError:
+                pass  # there is nowhere left to report a failed log write
+            for _ in batch:
+                self._queue.task_done()
+            if stop:
+                return
+
+    def flush(self):
+        """Wait until every message logged so far is written to the file"""
+        if self._writer is not None and self._pid == os.getpid():
+            self._queue.join()
+
+    def close(self):
+        """Write the remaining messages and stop the writer thread. Later messages are written directly."""
+        with self._close_lock:
+            if self._writer is None or self._pid != os.getpid():
+                return
+            self._queue.put(_STOP)
+            self._writer.join()
+            self._writer = None
+            # Messages other threads queued while the writer was stopping
+            leftover = []
+            while not self._queue.empty():
+                leftover.append(self._queue.get_nowait())
+            if leftover:
+                self._write([message for message in leftover if message is not _STOP])
+        atexit.unregister(self.close)
 
     def __del__(self):
-        self.log_file.close()
+        try:
+            self.close()
+            os.close(self._fd)
+        except (AttributeError, OSError):
+            pass
+
+
+@contextmanager
+def atomic_write(file_name):
+    """Open a temporary file next to file_name for writing, and replace file_name with it once the block
+    completes, so the file is never left partly written. The temporary file is removed if the block fails.
+
+    :param str file_name: the file to write
+    :rtype: Iterator[TextIO]
+    """
+    temp_name = file_name + '.tmp'
+    try:
+        with open(temp_name, 'w') as f_ptr:
+            yield f_ptr
+        os.replace(temp_name, file_name)
+    except BaseException:
+        if os.path.exists(temp_name):
+            os.remove(temp_name)
+        raise
 
 
 def get_valid_response(question, valid_responses, case_sensitive=False):